@@ -0,0 +1,252 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+from basejmpr.cli import (
+    display_info,
+    get_consumers,
+    get_revisions,
+    match_consumers,
+)
+from basejmpr.domain.backend import get_backend
+from basejmpr.domain.utils import create_domains
+from basejmpr.image.index import get_backing_files
+from basejmpr.image.qcow2 import make_header
+from basejmpr.profiler import PROFILER, get_version
+
+IMAGE_SIZE = 40 * 1024 ** 3
+NOOP_STUBS = ['virsh', 'virt-install', 'cloud-localds',
+              'write-mime-multipart', 'chattr']
+QEMU_IMG_STUB = """#!{python} -S
+import shutil
+import sys
+
+sys.path.insert(0, {path!r})
+from basejmpr.image.qcow2 import make_header
+
+args = sys.argv[1:]
+backing = None
+if '-b' in args:
+    backing = args[args.index('-b') + 1]
+
+if args[0] in ['create', 'rebase']:
+    img = args[-2] if args[0] == 'create' else args[-1]
+    with open(img, 'wb') as fd:
+        fd.write(make_header({size}, backing, 'qcow2' if backing else None))
+elif args[0] == 'convert':
+    shutil.copyfile(args[-2], args[-1])
+"""
+
+
+def _write(path, data):
+    with open(path, 'wb') as fd:
+        fd.write(data)
+
+
+def build_tree(root, num_images, num_revisions, series='jammy'):
+    backers = os.path.join(root, 'backing_files')
+    links = []
+    for rev in range(1, num_revisions + 1):
+        rdir = os.path.join(backers, str(rev))
+        os.makedirs(os.path.join(rdir, 'meta'))
+        os.makedirs(os.path.join(rdir, 'targets'))
+        target = os.path.join('targets',
+                              '{}-server-cloudimg-amd64.img'.format(series))
+        _write(os.path.join(rdir, target), make_header(IMAGE_SIZE))
+        sha256 = hashlib.sha256(str(rev).encode('utf-8')).hexdigest()
+        os.symlink(target, os.path.join(rdir, sha256))
+        links.append(os.path.join(rdir, sha256))
+
+    for idx in range(num_images):
+        dom_path = os.path.join(root, 'bench{}'.format(idx))
+        os.makedirs(dom_path)
+        _write(os.path.join(dom_path, 'bench{}.img'.format(idx)),
+               make_header(IMAGE_SIZE, links[idx % num_revisions], 'qcow2'))
+
+    return backers
+
+
+def write_stubs(bin_dir):
+    # Stand-ins for the virtualisation tools so that the provisioning path
+    # can be measured on hosts without KVM or libvirt.
+    os.makedirs(bin_dir, exist_ok=True)
+    stubs = {name: '#!/bin/sh\nexit 0\n' for name in NOOP_STUBS}
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    stubs['qemu-img'] = QEMU_IMG_STUB.format(python=sys.executable,
+                                             path=path, size=IMAGE_SIZE)
+    for name, content in stubs.items():
+        stub = os.path.join(bin_dir, name)
+        with open(stub, 'w') as fd:
+            fd.write(content)
+
+        os.chmod(stub, os.stat(stub).st_mode | stat.S_IXUSR | stat.S_IXGRP |
+                 stat.S_IXOTH)
+
+    os.environ['PATH'] = '{}:{}'.format(bin_dir, os.environ.get('PATH', ''))
+
+
+@contextlib.contextmanager
+def quiet():
+    # Subprocesses write to the real file descriptors so redirecting
+    # sys.stdout is not enough.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + [devnull]:
+            os.close(fd)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_scan(root, backers):
+    results = {}
+    results['get_revisions'] = timed(get_revisions, backers)
+    results['get_revisions_warm'] = timed(get_revisions, backers)
+    revisions = get_revisions(backers)
+    results['get_consumers_cold'] = timed(get_consumers, root, revisions,
+                                          reindex=True)
+    results['get_consumers_warm'] = timed(get_consumers, root, revisions)
+    backing_files = list(get_backing_files(root).items())
+    results['match_consumers'] = timed(match_consumers, backing_files,
+                                       revisions)
+    with quiet():
+        results['display_info'] = timed(display_info, root, backers,
+                                        revisions, None)
+
+    return results
+
+
+def bench_provision(root, backers, num_domains, parallel=1):
+    revisions = get_revisions(backers)
+    PROFILER.enable()
+    with quiet():
+        elapsed = timed(create_domains, root, backers, None, 'jammy',
+                        num_domains, revisions, 'bench', '40G', 'bench',
+                        1024, 1, 'hd', 'default', None, None, None, None,
+                        None, None, 'virtio', parallel=parallel,
+                        backend=get_backend('virsh'))
+
+    PROFILER.enabled = False
+    return {'create_domains': elapsed,
+            'domains_per_second': num_domains / elapsed,
+            'phases': PROFILER.summary()}
+
+
+def display_results(results):
+    for entry in results['scan']:
+        print("images={images} revisions={revisions}".format(**entry))
+        for name, elapsed in entry['results'].items():
+            print("  {:<24} {:>10.4f}s".format(name, elapsed))
+
+    for entry in results['provision']:
+        print("domains={domains} parallel={parallel}".format(**entry))
+        print("  {:<24} {:>10.4f}s ({:.1f} domains/s)".
+              format('create_domains', entry['results']['create_domains'],
+                     entry['results']['domains_per_second']))
+        for row in entry['results']['phases']:
+            print("  {:<24} {:>10.4f}s p50={:.4f}s p95={:.4f}s".
+                  format(row['name'], row['total'], row['p50'], row['p95']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=str, default='10,100,1000,10000',
+                        help="Comma-separated list of image counts to "
+                             "benchmark scanning with.")
+    parser.add_argument('--domains', type=str, default='10,100,1000',
+                        help="Comma-separated list of domain counts to "
+                             "benchmark provisioning with. An empty value "
+                             "skips provisioning.")
+    parser.add_argument('--parallel', type=int, default=os.cpu_count(),
+                        help="Number of domains to provision concurrently.")
+    parser.add_argument('--revisions', type=int, default=100,
+                        help="Number of revisions in each synthetic tree.")
+    parser.add_argument('--workdir', type=str, default=None,
+                        help="Directory in which to build synthetic trees. "
+                             "Defaults to a temporary directory.")
+    parser.add_argument('--output', type=str, default=None,
+                        help="Write results to this file as JSON.")
+    args = parser.parse_args()
+
+    results = {'version': get_version(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'cpus': os.cpu_count(),
+               'timestamp': time.time(),
+               'scan': [], 'provision': []}
+    for num_images in [int(n) for n in args.images.split(',') if n]:
+        root = tempfile.mkdtemp(dir=args.workdir)
+        try:
+            backers = build_tree(root, num_images, args.revisions)
+            results['scan'].append({'images': num_images,
+                                    'revisions': args.revisions,
+                                    'results': bench_scan(root, backers)})
+        finally:
+            shutil.rmtree(root)
+
+    stub_dir = tempfile.mkdtemp(dir=args.workdir)
+    try:
+        write_stubs(stub_dir)
+        for num_domains in [int(n) for n in args.domains.split(',') if n]:
+            root = tempfile.mkdtemp(dir=args.workdir)
+            try:
+                backers = build_tree(root, 0, 1)
+                results['provision'].append(
+                    {'domains': num_domains, 'parallel': args.parallel,
+                     'results': bench_provision(root, backers, num_domains,
+                                                args.parallel)})
+            finally:
+                shutil.rmtree(root)
+    finally:
+        shutil.rmtree(stub_dir)
+
+    display_results(results)
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,149 +20,280 @@
 # along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
 import argparse
 import collections
+import contextlib
+import functools
+import json
 import os
-import re
-import shutil
-import subprocess
+import sys
+
+from basejmpr.domain.backend import BACKENDS, DEFAULT_URI, get_backend
+from basejmpr.domain.manifest import load_manifest, plan_fleet
+from basejmpr.domain.pool import WarmPool, drop_pools
+from basejmpr.domain.scheduler import (
+    CapacityScheduler,
+    DEFAULT_RATIOS,
+    POLICIES,
+)
+from basejmpr.domain.storage import (
+    PREALLOCATION_MODES,
+    STRATEGIES,
+    check_root_disk_options,
+)
+from basejmpr.domain.utils import create_domains, get_revision, provision
+from basejmpr.image.bake import bake_revision
+from basejmpr.image.catalogue import get_catalogue, write_revision_meta
+from basejmpr.image.download import (
+    DEFAULT_BASE_URL,
+    DOWNLOADS_DIR,
+    download,
+    fetch_all,
+    parse_sha256sums,
+)
+from basejmpr.image.gc import (
+    delete_revision,
+    display_plan,
+    parse_duration,
+    plan_gc,
+    purge_trash,
+    run_rebases,
+)
+from basejmpr.image.index import get_backing_files, iter_backing_files
+from basejmpr.image.store import ImageStore, parse_size
+from basejmpr.image.watch import InventoryWatcher, serve
+from basejmpr.profiler import PROFILER
+
+
+def get_revision_index(base_revs):
+    return {(rev, img): rev for rev in base_revs
+            for img in base_revs[rev]['files']}
+
+
+def iter_consumers(backing_files, base_revs):
+    if not base_revs:
+        return
+
+    rev_index = get_revision_index(base_revs)
+    for img_path, backing in backing_files:
+        if not backing:
+            continue
+
+        name = os.path.basename(backing)
+        version = os.path.basename(os.path.dirname(backing))
+        if (version, name) not in rev_index:
+            yield img_path, {}
+            continue
+
+        yield img_path, {'version': version,
+                         'backing_file': os.path.join(version, name)}
+
+
+def match_consumers(backing_files, base_revs):
+    consumers = {}
+    _c_by_v = {}
+    for img_path, entry in iter_consumers(backing_files, base_revs):
+        if not entry:
+            consumers.setdefault(img_path, {})
+            continue
 
-from basejmpr.domain.utils import create_domains
+        consumers[img_path] = entry
+        _c_by_v.setdefault(entry['version'], []).append(
+            {'image': img_path, 'backing_file': entry['backing_file']})
 
+    return consumers, collections.OrderedDict(sorted(_c_by_v.items(),
+                                                     key=lambda t: t[0]))
 
-def get_consumers_by_version(consumers):
-    _c_by_v = {}
-    for img_path in consumers:
-        d = consumers[img_path]
-        ver = d.get('version')
-        if ver:
-            entry = {'image': img_path,
-                     'backing_file': d['backing_file']}
-            if ver in _c_by_v:
-                _c_by_v[ver].append(entry)
-            else:
-                _c_by_v[ver] = [entry]
-
-    return collections.OrderedDict(sorted(_c_by_v.items(),
-                                          key=lambda t: t[0]))
-
-
-def get_consumers(root_dir, base_revs):
-    consumers = {}
-    for path in os.listdir(root_dir):
-        newpath = os.path.join(root_dir, path)
-        if os.path.isdir(newpath):
-            for item in os.listdir(newpath):
-                img_path = os.path.join(newpath, item)
-                try:
-                    info = subprocess.check_output(['qemu-img', 'info',
-                                                    img_path],
-                                                   stderr=subprocess.STDOUT)
-                    info = info.decode('utf-8')
-                except subprocess.CalledProcessError:
-                    continue
-
-                for line in info.split('\n'):
-                    regex = r'^backing file: ([^\s]+)'
-                    res = re.search(regex, line)
-                    if res:
-                        for rev in base_revs:
-                            name = os.path.basename(res.group(1))
-                            version = os.path.dirname(res.group(1))
-                            version = os.path.basename(version)
-                            backing_file = os.path.join(version, name)
-                            for img in base_revs[rev]['files']:
-                                if backing_file == os.path.join(rev, img):
-                                    entry = consumers.get(img_path, {})
-                                    if entry.get('version'):
-                                        msg = ("Duplicate consumer entry "
-                                               "detected - {}".format(
-                                                   img_path))
-                                        raise Exception(msg)
-
-                                    entry['version'] = version
-                                    entry['backing_file'] = backing_file
-                                    consumers[img_path] = entry
-                                elif img_path not in consumers:
-                                    consumers[img_path] = {}
-
-    return consumers
-
-
-def create_revision(basedir, series, rev):
+
+def get_consumers(root_dir, base_revs, reindex=False):
+    backing_files = get_backing_files(root_dir, reindex=reindex)
+    return match_consumers(backing_files.items(), base_revs)[0]
+
+
+def create_revision(basedir, series, rev, base_url=DEFAULT_BASE_URL,
+                    cache_size=None):
     newpath = os.path.join(basedir, rev)
     if os.path.isdir(newpath):
         raise Exception("Base revision '{}' already exists".format(rev))
 
-    os.makedirs(newpath)
-    os.makedirs(os.path.join(newpath, 'meta'))
-    os.makedirs(os.path.join(newpath, 'targets'))
-    try:
-        items = [{'url':
-                  ('https://cloud-images.ubuntu.com/{}/current/'
-                   'SHA256SUMS'.format(series)),
-                  'out': os.path.join(newpath, 'meta/SHA256SUMS')},
-                 {'url': ('https://cloud-images.ubuntu.com/{series}/current/'
-                          '{series}-server-cloudimg-amd64.manifest'.
-                          format(series=series)),
-                  'out': os.path.join(newpath, 'meta/manifest')}]
-
-        _url = ('https://cloud-images.ubuntu.com/{}/current/'
-                '{}-server-cloudimg-amd64')
+    with get_catalogue(basedir).building(rev):
+        url = '{}/{}/current'.format(base_url.rstrip('/'), series)
+        manifest = '{}-server-cloudimg-amd64.manifest'.format(series)
+        fetch_all([('{}/SHA256SUMS'.format(url),
+                    os.path.join(newpath, 'meta/SHA256SUMS')),
+                   ('{}/{}'.format(url, manifest),
+                    os.path.join(newpath, 'meta/manifest'))])
+
         _url_extra = ''
         if series >= 'trusty':
             _url_extra = '-disk1'
 
-        items.append({'url': '{}{}.img'.format(_url.format(series, series),
-                                               _url_extra),
-                      'out': os.path.join(newpath, 'targets',
-                                          '{}-server-cloudimg-amd64{}.img'.
-                                          format(series, _url_extra))})
-
-        for item in items:
-            subprocess.check_output(['wget', '-O', item['out'],
-                                     item['url']])
-        revs = get_revisions(basedir, rev=rev)
-        with open(os.path.join(newpath, 'meta/SHA256SUMS')) as fd:
-            link = None
-            for line in fd.readlines():
-                for target in revs[rev]['targets']:
-                    if target in line:
-                        link = os.path.join(newpath,
-                                            line.partition(' ')[0])
-                        target = os.path.join('targets', target)
-                        subprocess.check_output(['chattr', '-i',
-                                                 os.path.join(newpath,
-                                                              target)])
-                        subprocess.check_output(['ln', '-fs',
-                                                 target, link])
-            if not link:
-                raise Exception("Unable to create target link")
-    except Exception:
-        shutil.rmtree(newpath)
-        raise
+        img = '{}-server-cloudimg-amd64{}.img'.format(series, _url_extra)
+        sums = parse_sha256sums(os.path.join(newpath, 'meta/SHA256SUMS'))
+        if img not in sums:
+            raise Exception("Unable to find checksum for '{}'".format(img))
+
+        target = os.path.join('targets', img)
+        store = ImageStore(basedir, max_size=cache_size)
+        sha256 = sums[img]
+        if not store.has(sha256):
+            # Adopt the image from an existing revision if it has one.
+            for r, info in get_revisions(basedir).items():
+                if r != rev and sha256 in info['files']:
+                    store.add(get_link(basedir, r, sha256), sha256)
+                    break
+
+        if store.has(sha256):
+            method = store.checkout(sha256, os.path.join(newpath, target))
+            print("INFO: using cached image {} ({})".format(sha256, method))
+        else:
+            # Partial downloads are kept outside of the revision so that
+            # they survive cleanup and can be resumed by the next attempt.
+            downloads = os.path.join(basedir, DOWNLOADS_DIR)
+            if not os.path.isdir(downloads):
+                os.makedirs(downloads)
+
+            download('{}/{}'.format(url, img), os.path.join(newpath, target),
+                     os.path.join(downloads, '{}.part'.format(sha256)),
+                     sha256=sha256)
+            store.add(os.path.join(newpath, target), sha256)
+
+        link = os.path.join(newpath, sha256)
+        PROFILER.check_output(['chattr', '-i',
+                               os.path.join(newpath, target)])
+        write_revision_meta(newpath, series, sha256,
+                            os.path.getsize(os.path.join(newpath, target)))
+        PROFILER.check_output(['ln', '-fs', target, link])
+
+    if store.max_size:
+        revisions = get_revisions(basedir)
+        consumers = get_consumers(os.path.dirname(basedir), revisions)
+        in_use = set(c['version'] for c in consumers.values()
+                     if c.get('version'))
+        store.evict(set(f for r in in_use for f in revisions[r]['files']))
+
+
+def gc_revisions(root_path, basedir, keep_last=1, keep_newer_than=None,
+                 rebase=False, dry_run=False, parallel=1):
+    purge_trash(basedir)
+    revisions = get_revisions(basedir)
+    backing_files = get_backing_files(root_path)
+    c_by_rev = match_consumers(backing_files.items(), revisions)[1]
+    store = ImageStore(basedir)
+    plan = plan_gc(revisions, c_by_rev, keep_last=keep_last,
+                   keep_newer_than=keep_newer_than, rebase=rebase,
+                   blobs=[b['sha256'] for b in store.blobs()])
+    display_plan(plan, revisions)
+    if dry_run:
+        return plan
+
+    failed = set()
+    for entry, ok in run_rebases(basedir, revisions, plan['rebase'],
+                                 parallel=parallel):
+        if not ok:
+            failed.add(entry['from'])
+
+    # Consumers are re-checked in case any appeared since the plan was made.
+    backing_files = get_backing_files(root_path)
+    c_by_rev = match_consumers(backing_files.items(), revisions)[1]
+    for rev in plan['delete']:
+        if rev in failed or c_by_rev.get(rev):
+            print("WARNING: revision {} still has consumers - not "
+                  "deleting".format(rev))
+            continue
+
+        drop_pools(root_path, os.path.join(basedir, rev))
+        delete_revision(basedir, rev)
+        print("INFO: deleted revision {}".format(rev))
+
+    # Revisions that could not be deleted still protect their images.
+    in_use = set(f for info in get_revisions(basedir).values()
+                 for f in info['files'])
+    for sha256 in store.prune(in_use, candidates=plan['prune']):
+        print("INFO: pruned image {} from image store".format(sha256))
+
+    return plan
 
 
 def get_revisions(basedir, rev=None):
-    revisions = {}
-    if os.path.isdir(basedir) and os.listdir(basedir):
-        for r in os.listdir(basedir):
-            if not rev or rev == r:
-                rdir = os.path.join(basedir, r)
-                contents = os.listdir(rdir)
-                contents1 = [c for c in contents if
-                             os.path.islink(os.path.join(rdir, c))]
-                contents2 = os.listdir(os.path.join(rdir, 'targets'))
-                revisions[r] = {'files': contents1,
-                                'targets': contents2}
-
-    return revisions
+    return get_catalogue(basedir).revisions(rev)
 
 
 def get_link(basedir, v, f):
-    return os.path.realpath(os.path.join(basedir, v, f))
+    path = os.path.join(basedir, v, f)
+    try:
+        target = os.readlink(path)
+    except OSError:
+        return os.path.realpath(path)
 
+    return os.path.normpath(os.path.join(os.path.dirname(path), target))
 
-def display_info(root_path, backers_path, revisions, required_rev,
-                 show_detached=False):
+
+def get_revision_records(backers_path, revisions):
+    for v in sorted(revisions.keys(), key=lambda k: int(k)):
+        yield {'type': 'revision', 'revision': v,
+               'files': {f: get_link(backers_path, v, f)
+                         for f in revisions[v]['files']}}
+
+
+def iter_info_records(root_path, backers_path, revisions, required_rev,
+                      show_detached=False, reindex=False, backing_files=None):
+    yield from get_revision_records(backers_path, revisions)
+    if backing_files is None:
+        backing_files = iter_backing_files(root_path, reindex=reindex)
+
+    for img_path, entry in iter_consumers(backing_files, revisions):
+        if not entry:
+            if show_detached:
+                yield {'type': 'detached', 'image': img_path}
+        elif not required_rev or required_rev == entry['version']:
+            yield {'type': 'consumer', 'image': img_path,
+                   'revision': entry['version'],
+                   'backing_file': entry['backing_file']}
+
+
+def get_info(records, show_detached=False):
+    info = {'revisions': {}, 'consumers': {}}
+    if show_detached:
+        info['detached'] = []
+
+    for record in records:
+        if record['type'] == 'revision':
+            info['revisions'][record['revision']] = record['files']
+        elif record['type'] == 'consumer':
+            info['consumers'].setdefault(record['revision'], []).append(
+                record['image'])
+        else:
+            info['detached'].append(record['image'])
+
+    return info
+
+
+def get_inventory(backers_path, backing_files):
+    records = iter_info_records(None, backers_path,
+                                get_revisions(backers_path), None,
+                                show_detached=True,
+                                backing_files=backing_files.items())
+    return get_info(records, show_detached=True)
+
+
+def display_info_json(root_path, backers_path, revisions, required_rev,
+                      show_detached=False, reindex=False):
+    records = iter_info_records(root_path, backers_path, revisions,
+                                required_rev, show_detached, reindex)
+    print(json.dumps(get_info(records, show_detached), indent=2,
+                     sort_keys=True))
+
+
+def display_info_ndjson(root_path, backers_path, revisions, required_rev,
+                        show_detached=False, reindex=False):
+    # Records are written as they are found so that consumers of the output
+    # can start before the scan completes.
+    for record in iter_info_records(root_path, backers_path, revisions,
+                                    required_rev, show_detached, reindex):
+        print(json.dumps(record), flush=True)
+
+
+def display_info_text(root_path, backers_path, revisions, required_rev,
+                      show_detached=False, reindex=False):
     print("Available revisions:")
     if revisions:
         for v in sorted(revisions.keys(), key=lambda k: int(k)):
@@ -172,9 +303,9 @@ def display_info(root_path, backers_path, revisions, required_rev,
     else:
         print("-")
 
-    consumers = get_consumers(root_path, revisions)
+    backing_files = get_backing_files(root_path, reindex=reindex)
+    consumers, c_by_rev = match_consumers(backing_files.items(), revisions)
     print("\nConsumers:")
-    c_by_rev = get_consumers_by_version(consumers)
     empty = True
     if c_by_rev:
         _rev = None
@@ -206,6 +337,34 @@ def display_info(root_path, backers_path, revisions, required_rev,
     print("")
 
 
+def display_info(root_path, backers_path, revisions, required_rev,
+                 show_detached=False, reindex=False, fmt='text'):
+    handlers = {'text': display_info_text,
+                'json': display_info_json,
+                'ndjson': display_info_ndjson}
+    handlers[fmt](root_path, backers_path, revisions, required_rev,
+                  show_detached=show_detached, reindex=reindex)
+
+
+@contextlib.contextmanager
+def diagnostics_to_stderr(enabled=True):
+    # Keeps machine-readable output on stdout parseable. This is done at the
+    # fd level since subprocesses write to fd 1 directly.
+    if not enabled:
+        yield
+        return
+
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--path', '-p', type=str,
@@ -220,11 +379,55 @@ def main():
                         default=False, help="Create a new revision if one "
                         "does not already exist. Use --revision to create a "
                         "specific one otherwise uses highest available + 1")
+    parser.add_argument('--image-url', type=str, default=DEFAULT_BASE_URL,
+                        help="Base url of the cloud image mirror used when "
+                             "creating revisions.")
+    parser.add_argument('--image-cache-size', type=str, default=None,
+                        help="Maximum size of the local cloud image cache "
+                             "e.g. 20G. Least recently used images that are "
+                             "not used by any consumers are evicted first. "
+                             "Default is unlimited.")
+    parser.add_argument('--bake', action='store_true', default=False,
+                        help="Create a new revision from --revision (or the "
+                             "newest revision of --series) with a "
+                             "dist-upgrade applied and --snaps/"
+                             "--snaps-classic staged in the image so that "
+                             "domains created from it do no package work "
+                             "at first boot. Requires snap and "
+                             "virt-customize.")
+    parser.add_argument('--no-dist-upgrade', action='store_true',
+                        default=False,
+                        help="Only stage snaps when using --bake.")
+    parser.add_argument('--gc', action='store_true', default=False,
+                        help="Delete revisions that have no consumers and "
+                             "are not retained by --keep-last or "
+                             "--keep-newer-than.")
+    parser.add_argument('--keep-last', type=int, default=1,
+                        help="Number of newest revisions per series that "
+                             "--gc always keeps.")
+    parser.add_argument('--keep-newer-than', type=str, default=None,
+                        help="Revisions newer than this are kept by --gc "
+                             "e.g. 12h, 30d, 4w.")
+    parser.add_argument('--rebase', action='store_true', default=False,
+                        help="With --gc, rebase consumers of revisions that "
+                             "would otherwise be deleted onto the newest "
+                             "revision of the same series using "
+                             "--parallel workers.")
+    parser.add_argument('--dry-run', action='store_true', default=False,
+                        help="With --gc, only show what would be done.")
     parser.add_argument('--show-detached', action='store_true', default=False,
                         help="Show qcow2 images that do not have a "
                         "revisioned backing file")
     parser.add_argument('--create', action='store_true',
                         default=False, help="Create a new domain.")
+    parser.add_argument('--manifest', type=str, default=None,
+                        help="Create a fleet of domains described by a YAML "
+                             "or JSON manifest. Each entry in its 'domains' "
+                             "list takes the same settings as the command "
+                             "line options e.g. name, num_domains, memory, "
+                             "revision. Settings in 'defaults' apply to all "
+                             "entries and command line options are used for "
+                             "anything not set.")
     parser.add_argument('--num-domains', type=int, default=None,
                         required=False, help="Number of domains to "
                         "create. (requires --create-new-domains)")
@@ -269,6 +472,31 @@ def main():
     parser.add_argument('--no-backingfile', default=False,
                         action='store_true',
                         help="Create root disk without a backing file.")
+    parser.add_argument('--root-disk-strategy', type=str, default='overlay',
+                        choices=STRATEGIES,
+                        help="How root disks are created from the backing "
+                             "file. overlay creates a qcow2 overlay backed "
+                             "by the revision, reflink makes an independent "
+                             "copy-on-write clone (btrfs/XFS, falls back to "
+                             "a full copy) and convert makes a full copy "
+                             "with qemu-img convert.")
+    parser.add_argument('--preallocation', type=str, default=None,
+                        choices=PREALLOCATION_MODES,
+                        help="qcow2 preallocation mode for root disks "
+                             "created with the convert strategy or with "
+                             "--no-backingfile. Overlays cannot be "
+                             "preallocated.")
+    parser.add_argument('--cluster-size', type=str, default=None,
+                        help="qcow2 cluster size for root disks created "
+                             "with the overlay or convert strategies e.g. "
+                             "64K or 2M.")
+    parser.add_argument('--warm-pool', type=int, default=None,
+                        help="Keep this many pre-built root and extra disks "
+                             "ready under --path for each combination of "
+                             "revision, root disk size and disk layout. "
+                             "Creates take disks from the pool when "
+                             "available and the pool is refilled in the "
+                             "background.")
     parser.add_argument('--num-disks', type=int, default=None,
                         help="Number of disks to attach to each domain.")
     parser.add_argument('--apt-proxy', type=str,
@@ -278,8 +506,91 @@ def main():
     parser.add_argument('--meta-data', type=str, default=None)
     parser.add_argument('--net-config', type=str, default=None)
     parser.add_argument('--disk-bus', type=str, default="virtio")
+    parser.add_argument('--backend', type=str, default='virsh',
+                        choices=BACKENDS,
+                        help="Backend used to query and define domains. The "
+                             "libvirt backend requires the libvirt python "
+                             "bindings.")
+    parser.add_argument('--libvirt-uri', type=str, default=None,
+                        help="Hypervisor connection uri used by the backend "
+                             "and by virsh/virt-install in create-domain.sh "
+                             "e.g. test:///default for testing. Defaults to "
+                             "{} for the libvirt backend.".format(DEFAULT_URI))
+    parser.add_argument('--virt-install', action='store_true', default=False,
+                        help="Generate domain xml with virt-install rather "
+                             "than natively.")
+    parser.add_argument('--format', type=str, default='text',
+                        choices=['text', 'json', 'ndjson'],
+                        help="Output format for revision and consumer info. "
+                             "ndjson streams one record per line while "
+                             "images are scanned.")
+    parser.add_argument('--reindex', action='store_true', default=False,
+                        help="Discard the consumer index and re-probe every "
+                             "image under --path.")
+    parser.add_argument('--parallel', type=int, default=1,
+                        help="Number of domains to provision concurrently "
+                             "when creating more than one.")
+    parser.add_argument('--capacity-policy', type=str, default='off',
+                        choices=POLICIES,
+                        help="Check domains against host memory, cpu and "
+                             "disk (of --path) once overcommit ratios are "
+                             "applied. admit creates those that fit and "
+                             "skips the rest, reject creates nothing. Both "
+                             "exit non-zero if any domain does not fit. "
+                             "Defaults to off since domains are defined but "
+                             "not started.")
+    parser.add_argument('--overcommit-memory', type=float,
+                        default=DEFAULT_RATIOS['memory'],
+                        help="Ratio applied to available host memory.")
+    parser.add_argument('--overcommit-cpu', type=float,
+                        default=DEFAULT_RATIOS['cpu'],
+                        help="Ratio of domain vcpus to host cpus.")
+    parser.add_argument('--overcommit-disk', type=float,
+                        default=DEFAULT_RATIOS['disk'],
+                        help="Ratio of domain virtual disk sizes to free "
+                             "space.")
+    parser.add_argument('--watch', action='store_true', default=False,
+                        help="Keep running and update the consumer and "
+                             "detached inventory from inotify events, "
+                             "re-probing only changed images. Publish it "
+                             "with --watch-output and/or --watch-socket.")
+    parser.add_argument('--watch-output', type=str, default=None,
+                        help="JSON file that --watch keeps up to date.")
+    parser.add_argument('--watch-socket', type=str, default=None,
+                        help="Unix socket on which --watch serves the "
+                             "current inventory as JSON to each client.")
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help="Record the wall and cpu time of every phase "
+                             "and subprocess and print a p50/p95 summary.")
+    parser.add_argument('--profile-output', type=str, default=None,
+                        help="Write the --profile events to this path as a "
+                             "Chrome trace (chrome://tracing, Perfetto). "
+                             "Implies --profile.")
     args = parser.parse_args()
 
+    if args.profile or args.profile_output:
+        PROFILER.enable()
+
+    machine = args.format != 'text'
+    try:
+        with diagnostics_to_stderr(machine):
+            info = _main(args)
+
+        if info:
+            with PROFILER.phase('display_info'):
+                display_info(*info, args.revision,
+                             show_detached=args.show_detached,
+                             reindex=args.reindex, fmt=args.format)
+    finally:
+        if PROFILER.enabled:
+            with diagnostics_to_stderr(machine):
+                PROFILER.display_summary()
+                if args.profile_output:
+                    PROFILER.write_trace(args.profile_output)
+
+
+def _main(args):
+
     root_path = os.path.realpath(args.path)
     series = args.series
     backers_path = os.path.join(root_path, 'backing_files')
@@ -287,6 +598,9 @@ def main():
     if not os.path.isdir(root_path):
         raise Exception("Non-existent path '%s'" % (root_path))
 
+    check_root_disk_options(args.root_disk_strategy, args.preallocation,
+                            not args.no_backingfile, args.cluster_size)
+
     revisions = get_revisions(backers_path)
 
     rev = args.revision
@@ -297,11 +611,69 @@ def main():
         elif not rev:
             rev = str(max((int(k) for k in revisions)) + 1)
 
-        create_revision(backers_path, series, rev)
+        cache_size = None
+        if args.image_cache_size:
+            cache_size = parse_size(args.image_cache_size)
+
+        with PROFILER.phase('create_revision'):
+            create_revision(backers_path, series, rev,
+                            base_url=args.image_url, cache_size=cache_size)
+
+    if args.bake:
+        revisions = get_revisions(backers_path)
+        with PROFILER.phase('bake_revision'):
+            bake_revision(backers_path,
+                          get_revision(revisions, args.revision, series),
+                          snap_dict={'classic': args.snaps_classic,
+                                     'stable': args.snaps},
+                          dist_upgrade=not args.no_dist_upgrade)
+
+        print("")  # blank line
+
+    if args.gc:
+        keep_newer_than = None
+        if args.keep_newer_than:
+            keep_newer_than = parse_duration(args.keep_newer_than)
+
+        with PROFILER.phase('gc'):
+            gc_revisions(root_path, backers_path, keep_last=args.keep_last,
+                         keep_newer_than=keep_newer_than, rebase=args.rebase,
+                         dry_run=args.dry_run, parallel=args.parallel)
+        print("")  # blank line
 
     # refresh
     filtered_revisions = get_revisions(backers_path, args.revision)
-    if args.create:
+    warm_pool = None
+    if args.warm_pool:
+        warm_pool = WarmPool(root_path, args.warm_pool)
+
+    scheduler = None
+    if args.capacity_policy != 'off':
+        scheduler = CapacityScheduler(root_path,
+                                      {'memory': args.overcommit_memory,
+                                       'cpu': args.overcommit_cpu,
+                                       'disk': args.overcommit_disk},
+                                      args.capacity_policy)
+
+    if args.manifest:
+        backend = get_backend(args.backend, args.libvirt_uri)
+        groups = load_manifest(args.manifest, vars(args))
+        with PROFILER.phase('list_domains'):
+            existing = backend.list_domains()
+
+        with PROFILER.phase('plan_domains'):
+            domains = plan_fleet(root_path, backers_path,
+                                 get_revisions(backers_path), groups,
+                                 force=args.force, existing=existing,
+                                 define_domain=not backend.defines_domains,
+                                 use_virt_install=args.virt_install,
+                                 warm_pool=warm_pool,
+                                 libvirt_uri=backend.uri)
+
+        provision(domains, backend, parallel=args.parallel,
+                  skip_cleanup=args.no_cleanup, scheduler=scheduler)
+        print("")  # blank line
+    elif args.create:
         snaps = {'classic': args.snaps_classic,
                  'stable': args.snaps}
         revisions = get_revisions(backers_path)
@@ -319,8 +691,22 @@ def main():
                        args.no_backingfile,
                        args.no_cleanup,
                        nic_prefix=args.nic_prefix,
-                       snap_dict=snaps)
+                       snap_dict=snaps,
+                       parallel=args.parallel,
+                       backend=get_backend(args.backend, args.libvirt_uri),
+                       use_virt_install=args.virt_install,
+                       root_disk_strategy=args.root_disk_strategy,
+                       preallocation=args.preallocation,
+                       cluster_size=args.cluster_size,
+                       warm_pool=warm_pool,
+                       scheduler=scheduler)
         print("")  # blank line
 
-    display_info(root_path, backers_path, filtered_revisions, args.revision,
-                 show_detached=args.show_detached)
+    if args.watch:
+        watcher = InventoryWatcher(
+            root_path, backers_path,
+            functools.partial(get_inventory, backers_path))
+        serve(watcher, output=args.watch_output, sock_path=args.watch_socket)
+        return None
+
+    return root_path, backers_path, filtered_revisions
@@ -0,0 +1,93 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+import shutil
+
+from basejmpr.domain.render import get_source
+from basejmpr.image.store import sha256sum
+
+ARTIFACTS_FILE = '.artifacts.json'
+# Bump when the way artifacts are generated changes outside of templates.
+ARTIFACTS_VERSION = 1
+TEMPLATES = ['create-domain.sh', 'create-storage.sh', 'user-data',
+             'meta-data', 'snap_install.sh']
+
+
+def get_artifacts_key(ctxt, inputs=None):
+    checksum = hashlib.sha256(json.dumps(
+        {'version': ARTIFACTS_VERSION, 'ctxt': ctxt}, sort_keys=True,
+        default=str).encode('utf-8'))
+    for name in TEMPLATES:
+        checksum.update(get_source(name).encode('utf-8'))
+
+    for path in inputs or []:
+        if path:
+            checksum.update(path.encode('utf-8'))
+            checksum.update(sha256sum(path).encode('utf-8'))
+
+    return checksum.hexdigest()
+
+
+def load_artifacts(dom_path):
+    try:
+        with open(os.path.join(dom_path, ARTIFACTS_FILE)) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_artifacts(dom_path, key, names):
+    files = {name: sha256sum(os.path.join(dom_path, name)) for name in names}
+    tmp = os.path.join(dom_path, '{}.tmp'.format(ARTIFACTS_FILE))
+    with open(tmp, 'w') as fd:
+        json.dump({'key': key, 'files': files}, fd, indent=2, sort_keys=True)
+
+    os.replace(tmp, os.path.join(dom_path, ARTIFACTS_FILE))
+
+
+def verify_artifacts(dom_path, key):
+    manifest = load_artifacts(dom_path)
+    if not manifest or manifest.get('key') != key:
+        return False
+
+    for name, digest in manifest['files'].items():
+        try:
+            if sha256sum(os.path.join(dom_path, name)) != digest:
+                return False
+        except OSError:
+            return False
+
+    return True
+
+
+def prune_artifacts(dom_path):
+    # Everything that is not a cached artifact (disks) is recreated.
+    keep = set(load_artifacts(dom_path).get('files', {})) | {ARTIFACTS_FILE}
+    for entry in os.scandir(dom_path):
+        if entry.name in keep:
+            continue
+
+        if entry.is_dir():
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
@@ -0,0 +1,105 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import threading
+
+from basejmpr.profiler import PROFILER
+
+try:
+    import libvirt
+except ImportError:
+    libvirt = None
+
+BACKENDS = ['virsh', 'libvirt']
+DEFAULT_URI = 'qemu:///system'
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def get_connection(uri):
+    with _CONNECTIONS_LOCK:
+        conn = _CONNECTIONS.get(uri)
+        if conn is None or not conn.isAlive():
+            conn = libvirt.open(uri)
+            _CONNECTIONS[uri] = conn
+
+        return conn
+
+
+class VirshBackend():
+    # Domains are (re)defined by create-domain.sh
+    defines_domains = False
+
+    def __init__(self, uri=None):
+        self.uri = uri
+
+    def _cmd(self, *args):
+        cmd = ['virsh']
+        if self.uri:
+            cmd += ['-c', self.uri]
+
+        return cmd + list(args)
+
+    def list_domains(self):
+        out = PROFILER.check_output(self._cmd('list', '--all', '--name'))
+        return set(line.strip() for line in out.decode('utf-8').split('\n')
+                   if line.strip())
+
+
+class LibvirtBackend():
+    defines_domains = True
+
+    def __init__(self, uri=DEFAULT_URI):
+        if libvirt is None:
+            raise Exception("The libvirt backend requires the libvirt python "
+                            "bindings (python3-libvirt)")
+
+        self.uri = uri
+
+    @property
+    def conn(self):
+        return get_connection(self.uri)
+
+    def list_domains(self):
+        return set(dom.name() for dom in self.conn.listAllDomains())
+
+    def define(self, name, xml):
+        try:
+            dom = self.conn.lookupByName(name)
+        except libvirt.libvirtError:
+            dom = None
+
+        if dom is not None:
+            if dom.isActive():
+                dom.destroy()
+
+            dom.undefine()
+
+        self.conn.defineXML(xml)
+
+
+def get_backend(name='virsh', uri=None):
+    if name == 'libvirt':
+        return LibvirtBackend(uri or DEFAULT_URI)
+
+    if name == 'virsh':
+        return VirshBackend(uri)
+
+    raise Exception("Unknown backend '{}'".format(name))
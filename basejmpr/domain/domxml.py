@@ -0,0 +1,135 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import xml.etree.ElementTree as ET
+
+DISK_PREFIXES = {'virtio': 'vd', 'scsi': 'sd', 'sata': 'sd', 'usb': 'sd',
+                 'ide': 'hd'}
+
+
+def _sub(parent, tag, text=None, **attrs):
+    elem = ET.SubElement(parent, tag, attrs)
+    if text is not None:
+        elem.text = str(text)
+
+    return elem
+
+
+def _indent(elem, level=0):
+    # Equivalent of ET.indent() which is only available from Python 3.9.
+    children = list(elem)
+    if not children:
+        return
+
+    pad = '\n' + '  ' * (level + 1)
+    if not elem.text or not elem.text.strip():
+        elem.text = pad
+
+    for child in children:
+        _indent(child, level + 1)
+        if not child.tail or not child.tail.strip():
+            child.tail = pad
+
+    children[-1].tail = '\n' + '  ' * level
+
+
+class _DiskTargets():
+    def __init__(self):
+        self.used = {}
+
+    def next(self, bus):
+        prefix = DISK_PREFIXES.get(bus, 'sd')
+        idx = self.used.get(prefix, 0)
+        self.used[prefix] = idx + 1
+        name = ''
+        idx += 1
+        while idx:
+            idx, rem = divmod(idx - 1, 26)
+            name = chr(ord('a') + rem) + name
+
+        return prefix + name
+
+
+def _add_disk(devices, targets, path, fmt, bus):
+    disk = _sub(devices, 'disk', type='file', device='disk')
+    _sub(disk, 'driver', name='qemu', type=fmt)
+    _sub(disk, 'source', file=path)
+    _sub(disk, 'target', dev=targets.next(bus), bus=bus)
+
+
+def generate_domain_xml(ctxt):
+    dom_path = os.path.dirname(ctxt['img_path'])
+    domain = ET.Element('domain', type='kvm')
+    _sub(domain, 'name', ctxt['name'])
+    _sub(domain, 'memory', ctxt['mem'], unit='MiB')
+    _sub(domain, 'currentMemory', ctxt['mem'], unit='MiB')
+    _sub(domain, 'vcpu', ctxt['vcpus'], placement='static')
+    os_elem = _sub(domain, 'os')
+    _sub(os_elem, 'type', 'hvm', arch='x86_64')
+    for dev in ctxt['boot_order'].split(','):
+        _sub(os_elem, 'boot', dev=dev.strip())
+
+    features = _sub(domain, 'features')
+    _sub(features, 'acpi')
+    _sub(features, 'apic')
+    _sub(domain, 'cpu', mode='host-passthrough')
+    _sub(domain, 'clock', offset='utc')
+    _sub(domain, 'on_poweroff', 'destroy')
+    _sub(domain, 'on_reboot', 'restart')
+    _sub(domain, 'on_crash', 'destroy')
+
+    devices = _sub(domain, 'devices')
+    targets = _DiskTargets()
+    buses = [ctxt['primary_disk']['bus']]
+    _add_disk(devices, targets, ctxt['img_path'], 'qcow2',
+              ctxt['primary_disk']['bus'])
+    for disk in ctxt.get('disks') or []:
+        buses.append(disk['bus'])
+        _add_disk(devices, targets, os.path.join(dom_path, disk['name']),
+                  'qcow2', disk['bus'])
+
+    if ctxt.get('seed_path'):
+        _add_disk(devices, targets, ctxt['seed_path'], 'raw', 'virtio')
+
+    if 'scsi' in buses:
+        _sub(devices, 'controller', type='scsi', index='0',
+             model='virtio-scsi')
+
+    for idx, network in enumerate(ctxt['networks']):
+        iface = _sub(devices, 'interface', type='network')
+        _sub(iface, 'source', network=network)
+        _sub(iface, 'model', type='virtio')
+        if ctxt.get('nic_prefix'):
+            # user aliases must be prefixed with ua-
+            _sub(iface, 'alias',
+                 name='ua-{}{}'.format(ctxt['nic_prefix'], idx))
+
+    _sub(devices, 'serial', type='pty')
+    _sub(devices, 'console', type='pty')
+    _sub(devices, 'graphics', type='vnc', port='-1')
+    video = _sub(devices, 'video')
+    _sub(video, 'model', type='virtio')
+    rng = _sub(devices, 'rng', model='virtio')
+    _sub(rng, 'backend', '/dev/urandom', model='random')
+    _sub(devices, 'memballoon', model='virtio')
+
+    _indent(domain)
+    return ET.tostring(domain, encoding='unicode') + '\n'
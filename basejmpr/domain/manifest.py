@@ -0,0 +1,157 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from basejmpr.domain.storage import check_root_disk_options
+from basejmpr.domain.utils import (
+    get_domain_names,
+    get_revision,
+    plan_domains,
+)
+
+# Keys that can be set in the manifest defaults or per group. These share
+# their names with the equivalent command line options.
+GROUP_KEYS = ['name', 'num_domains', 'series', 'revision', 'root_disk_size',
+              'ssh_lp_id', 'memory', 'vcpus', 'boot_order', 'networks',
+              'num_disks', 'disk_bus', 'nic_prefix', 'apt_proxy',
+              'init_script', 'user_data', 'meta_data', 'net_config', 'snaps',
+              'snaps_classic', 'no_seed', 'no_backingfile',
+              'root_disk_strategy', 'preallocation', 'cluster_size']
+PATH_KEYS = ['init_script', 'user_data', 'meta_data', 'net_config']
+LIST_KEYS = ['networks', 'snaps', 'snaps_classic']
+ALIASES = {'count': 'num_domains'}
+
+
+def _normalise(entry, basedir):
+    if not isinstance(entry, dict):
+        raise Exception("Invalid manifest entry '{}'".format(entry))
+
+    group = {}
+    for key, value in entry.items():
+        key = ALIASES.get(key, key.replace('-', '_'))
+        if key not in GROUP_KEYS:
+            raise Exception("Unknown manifest key '{}'".format(key))
+
+        if key in LIST_KEYS and isinstance(value, list):
+            value = ','.join(value)
+        elif key in PATH_KEYS and value:
+            value = os.path.join(basedir, os.path.expanduser(value))
+        elif key == 'revision' and value is not None:
+            value = str(value)
+
+        group[key] = value
+
+    return group
+
+
+def load_manifest(path, defaults):
+    with open(path) as fd:
+        content = fd.read()
+
+    if os.path.splitext(path)[1] in ['.yaml', '.yml']:
+        if yaml is None:
+            raise Exception("YAML manifests require PyYAML - use JSON or "
+                            "install python3-yaml")
+
+        data = yaml.safe_load(content)
+    else:
+        data = json.loads(content)
+
+    if not isinstance(data, dict) or not data.get('domains'):
+        raise Exception("Manifest '{}' has no domains".format(path))
+
+    basedir = os.path.dirname(os.path.abspath(path))
+    base = {key: defaults.get(key) for key in GROUP_KEYS}
+    base.update(_normalise(data.get('defaults') or {}, basedir))
+    groups = []
+    for entry in data['domains']:
+        group = dict(base)
+        group.update(_normalise(entry, basedir))
+        if not group.get('name'):
+            raise Exception("Manifest domain groups must have a name")
+
+        groups.append(group)
+
+    return groups
+
+
+def validate_groups(base_revisions, groups):
+    seen = set()
+    for group in groups:
+        for name in get_domain_names(group['name'], group['num_domains']):
+            if name in seen:
+                raise Exception("Domain '{}' is defined more than once in "
+                                "manifest".format(name))
+
+            seen.add(name)
+
+        get_revision(base_revisions, group['revision'], group['series'])
+        check_root_disk_options(group['root_disk_strategy'],
+                                group['preallocation'],
+                                not group['no_backingfile'],
+                                group['cluster_size'])
+        for key in ['init_script', 'user_data', 'meta_data', 'net_config']:
+            if group[key] and not os.path.isfile(group[key]):
+                raise Exception("Manifest group '{}' {} '{}' does not "
+                                "exist".format(group['name'], key,
+                                               group[key]))
+
+
+def plan_fleet(root, base_root, base_revisions, groups, force=False,
+               existing=None, define_domain=True, use_virt_install=False,
+               warm_pool=None, libvirt_uri=None):
+    # Every group is validated before any is planned so that a bad group
+    # cannot leave the fleet partially planned.
+    validate_groups(base_revisions, groups)
+    domains = []
+    for group in groups:
+        snaps = {'classic': group['snaps_classic'],
+                 'stable': group['snaps']}
+        domains += plan_domains(root, base_root, group['revision'],
+                                group['series'], group['num_domains'],
+                                base_revisions, group['name'],
+                                group['root_disk_size'], group['ssh_lp_id'],
+                                group['memory'], group['vcpus'],
+                                group['boot_order'], group['networks'],
+                                group['num_disks'], group['apt_proxy'],
+                                group['init_script'], group['user_data'],
+                                group['meta_data'], group['net_config'],
+                                group['disk_bus'], force=force,
+                                skip_seed=group['no_seed'],
+                                skip_backingfile=group['no_backingfile'],
+                                nic_prefix=group['nic_prefix'],
+                                snap_dict=snaps, existing=existing,
+                                define_domain=define_domain,
+                                use_virt_install=use_virt_install,
+                                root_disk_strategy=group[
+                                    'root_disk_strategy'],
+                                preallocation=group['preallocation'],
+                                cluster_size=group['cluster_size'],
+                                warm_pool=warm_pool,
+                                libvirt_uri=libvirt_uri)
+
+    return domains
@@ -0,0 +1,167 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+
+from basejmpr.domain.storage import create_overlay, create_root_disk
+
+POOL_DIR = '.pool'
+SPEC_FILE = '.spec.json'
+LOCK_FILE = '.lock'
+ROOT_DISK = 'root.img'
+
+
+def get_spec(ctxt):
+    return {'backingfile': ctxt.get('backingfile'),
+            'root_size': ctxt['root_size'],
+            'root_strategy': ctxt.get('root_strategy'),
+            'preallocation': ctxt.get('preallocation'),
+            'cluster_size': ctxt.get('cluster_size'),
+            'disks': [{'name': d['name'], 'size': d['size']}
+                      for d in ctxt.get('disks') or []]}
+
+
+class WarmPool():
+    def __init__(self, root, size):
+        self.path = os.path.join(root, POOL_DIR)
+        self.size = size
+
+    def key_path(self, spec):
+        key = hashlib.sha256(json.dumps(spec, sort_keys=True).
+                             encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.path, key)
+
+    def slots(self, spec):
+        path = self.key_path(spec)
+        if not os.path.isdir(path):
+            return []
+
+        return [os.path.join(path, s) for s in sorted(os.listdir(path))
+                if not s.startswith('.')]
+
+    def take(self, ctxt, dom_path):
+        spec = get_spec(ctxt)
+        for slot in self.slots(spec):
+            claimed = os.path.join(os.path.dirname(slot),
+                                   '.claimed-{}'.format(uuid.uuid4()))
+            try:
+                # Atomic so that concurrent creates never share a slot
+                os.rename(slot, claimed)
+            except OSError:
+                continue
+
+            os.rename(os.path.join(claimed, ROOT_DISK), ctxt['img_path'])
+            for disk in spec['disks']:
+                os.rename(os.path.join(claimed, disk['name']),
+                          os.path.join(dom_path, disk['name']))
+
+            shutil.rmtree(claimed)
+            return True
+
+        return False
+
+    def _build_slot(self, spec):
+        path = self.key_path(spec)
+        building = os.path.join(path, '.building-{}'.format(uuid.uuid4()))
+        os.makedirs(building)
+        try:
+            ctxt = dict(spec, name=os.path.basename(building),
+                        img_path=os.path.join(building, ROOT_DISK))
+            create_root_disk(ctxt)
+            for disk in spec['disks']:
+                create_overlay(os.path.join(building, disk['name']),
+                               disk['size'])
+
+            os.rename(building, os.path.join(path, str(uuid.uuid4())))
+        except Exception:
+            shutil.rmtree(building)
+            raise
+
+    def fill(self, spec):
+        path = self.key_path(spec)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        with open(os.path.join(path, LOCK_FILE), 'w') as lockfd:
+            try:
+                fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another process is already filling this pool
+                return
+
+            for entry in os.listdir(path):
+                if entry.startswith('.building-'):
+                    shutil.rmtree(os.path.join(path, entry))
+
+            while len(self.slots(spec)) < self.size:
+                self._build_slot(spec)
+
+    def refill_async(self, spec):
+        path = self.key_path(spec)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        with open(os.path.join(path, SPEC_FILE), 'w') as fd:
+            json.dump(spec, fd)
+
+        with open(os.path.join(path, '.refill.log'), 'a') as log:
+            # Detached so that the refill carries on after we exit.
+            subprocess.Popen(  # pylint: disable=consider-using-with
+                [sys.executable, '-m', 'basejmpr.domain.pool', path,
+                 str(self.size)], stdout=log, stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+def drop_pools(root, backing_dir):
+    path = os.path.join(root, POOL_DIR)
+    if not os.path.isdir(path):
+        return
+
+    for key in os.listdir(path):
+        try:
+            with open(os.path.join(path, key, SPEC_FILE)) as fd:
+                spec = json.load(fd)
+        except (OSError, ValueError):
+            continue
+
+        backingfile = spec.get('backingfile') or ''
+        if backingfile.startswith(backing_dir + os.sep):
+            print("INFO: dropping warm pool {}".format(key))
+            shutil.rmtree(os.path.join(path, key))
+
+
+def main():
+    path, size = sys.argv[1], int(sys.argv[2])
+    with open(os.path.join(path, SPEC_FILE)) as fd:
+        spec = json.load(fd)
+
+    root = os.path.dirname(os.path.dirname(path))
+    WarmPool(root, size).fill(spec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import functools
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+CACHE_DIR_ENV = 'BASEJMPR_CACHE_DIR'
+
+
+def get_cache_dir(*subdirs):
+    path = os.environ.get(CACHE_DIR_ENV)
+    if not path:
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                           os.path.expanduser('~/.cache')),
+                            'basejmpr')
+
+    return os.path.join(path, *subdirs)
+
+
+@functools.lru_cache(maxsize=None)
+def get_environment():
+    bytecode_cache = None
+    path = get_cache_dir('jinja2')
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        bytecode_cache = FileSystemBytecodeCache(path)
+    except OSError as exc:
+        print("WARNING: template bytecode cache disabled - {}".format(exc))
+
+    # Templates are shipped with the package so there is no need to check
+    # them for changes once loaded.
+    return Environment(loader=PackageLoader('basejmpr.domain', 'templates'),
+                       bytecode_cache=bytecode_cache, auto_reload=False)
+
+
+def get_template(name):
+    return get_environment().get_template(name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_source(name):
+    env = get_environment()
+    return env.loader.get_source(env, name)[0]
+
+
+def render(name, ctxt):
+    return get_template(name).render(**ctxt)
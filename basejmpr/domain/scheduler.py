@@ -0,0 +1,135 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+
+from basejmpr.image.store import parse_size
+
+MEMINFO = '/proc/meminfo'
+RESOURCES = ['memory', 'cpu', 'disk']
+POLICIES = ['off', 'admit', 'reject']
+# Memory is not overcommitted by default since that is what leads to hosts
+# swapping once the domains are started.
+DEFAULT_RATIOS = {'memory': 1.0, 'cpu': 16.0, 'disk': 4.0}
+
+
+def read_meminfo(path=MEMINFO):
+    info = {}
+    with open(path) as fd:
+        for line in fd:
+            key, _, value = line.partition(':')
+            value = value.split()
+            if not value:
+                continue
+
+            info[key] = int(value[0])
+            if len(value) > 1 and value[1] == 'kB':
+                info[key] *= 1024
+
+    return info
+
+
+def get_host_capacity(path):
+    meminfo = read_meminfo()
+    stat = os.statvfs(path)
+    return {'memory': meminfo.get('MemAvailable', meminfo['MemFree']),
+            'cpu': len(os.sched_getaffinity(0)),
+            'disk': stat.f_bavail * stat.f_frsize,
+            'load': os.getloadavg()[0]}
+
+
+def get_demand(ctxt):
+    disk = parse_size(ctxt.get('root_size') or '0')
+    for extra in ctxt.get('disks') or []:
+        disk += parse_size(extra['size'])
+
+    return {'memory': int(ctxt['mem']) * 1024 ** 2,
+            'cpu': int(ctxt['vcpus']),
+            'disk': disk}
+
+
+def format_amount(resource, value):
+    if resource == 'cpu':
+        return '{:g}'.format(value)
+
+    return '{:.1f}G'.format(value / 1024 ** 3)
+
+
+class CapacityScheduler():
+
+    def __init__(self, path, ratios=None, policy='admit'):
+        self.path = path
+        self.ratios = dict(DEFAULT_RATIOS, **(ratios or {}))
+        self.policy = policy
+
+    def plan(self, domains, parallel=1, capacity=None):
+        capacity = capacity or get_host_capacity(self.path)
+        limits = {r: capacity[r] * self.ratios[r] for r in RESOURCES}
+        used = dict.fromkeys(RESOURCES, 0)
+        admitted = []
+        rejected = []
+        for dom in domains:
+            demand = get_demand(dom['ctxt'])
+            over = [r for r in RESOURCES if used[r] + demand[r] > limits[r]]
+            if over:
+                rejected.append((dom, over))
+                continue
+
+            for r in RESOURCES:
+                used[r] += demand[r]
+
+            admitted.append(dom)
+
+        # Creation itself is cpu and io bound so only use the idle cpus.
+        idle = max(1, int(capacity['cpu'] - capacity['load']))
+        return {'admitted': admitted, 'rejected': rejected, 'used': used,
+                'limits': limits, 'parallel': parallel,
+                'concurrency': max(1, min(parallel or 1, idle))}
+
+    def display_plan(self, plan):
+        print("INFO: host capacity (used/limit):")
+        for r in RESOURCES:
+            print("  {}: {}/{} (overcommit {:g})".format(
+                r, format_amount(r, plan['used'][r]),
+                format_amount(r, plan['limits'][r]), self.ratios[r]))
+
+        for dom, over in plan['rejected']:
+            print("WARNING: domain '{}' exceeds host {} capacity".
+                  format(dom['name'], ', '.join(over)))
+
+        if plan['concurrency'] < plan['parallel']:
+            print("INFO: throttling creation to {} concurrent domain(s) "
+                  "(requested {})".format(plan['concurrency'],
+                                          plan['parallel']))
+
+    def schedule(self, domains, parallel=1):
+        plan = self.plan(domains, parallel)
+        self.display_plan(plan)
+        if plan['rejected']:
+            if self.policy == 'reject':
+                raise Exception("Host capacity exceeded by {} of {} "
+                                "domain(s) - nothing created".
+                                format(len(plan['rejected']), len(domains)))
+
+            print("WARNING: skipping {} domain(s) that exceed host "
+                  "capacity".format(len(plan['rejected'])))
+
+        skipped = [dom['name'] for dom, _ in plan['rejected']]
+        return plan['admitted'], plan['concurrency'], skipped
@@ -0,0 +1,266 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import os
+import struct
+from email.mime.text import MIMEText
+
+from basejmpr.domain.render import render
+
+SECTOR_SIZE = 2048
+# Fields that vary between domains in a batch are rendered with this in place
+# of the domain name and substituted when each seed is built.
+NAME_PLACEHOLDER = '__BASEJMPR_DOMAIN_NAME__'
+USER_DATA_TYPES = [('#cloud-config-archive', 'cloud-config-archive'),
+                   ('#cloud-config', 'cloud-config'),
+                   ('#cloud-boothook', 'cloud-boothook'),
+                   ('#include', 'x-include-url'),
+                   ('#part-handler', 'part-handler'),
+                   ('#upstart-job', 'upstart-job'),
+                   ('#!', 'x-shellscript')]
+
+
+def _both16(value):
+    return struct.pack('<H', value) + struct.pack('>H', value)
+
+
+def _both32(value):
+    return struct.pack('<I', value) + struct.pack('>I', value)
+
+
+def _pad(data, size, fill=b'\0'):
+    return data + fill * (size - len(data))
+
+
+def _text(value, size, joliet):
+    if joliet:
+        return _pad(value.encode('utf-16-be'), size, b'\0 ')[:size]
+
+    return _pad(value.encode('ascii'), size, b' ')[:size]
+
+
+def _primary_name(name, taken):
+    base, _, ext = name.upper().partition('.')
+    base = ''.join(c if c.isalnum() else '_' for c in base)[:8]
+    ext = ''.join(c if c.isalnum() else '_' for c in ext)[:3]
+    ident = '{}.{}'.format(base, ext)
+    count = 0
+    while ident in taken:
+        count += 1
+        suffix = str(count)
+        ident = '{}{}.{}'.format(base[:8 - len(suffix)], suffix, ext)
+
+    taken.add(ident)
+    return '{};1'.format(ident)
+
+
+def _dir_record(ident, extent, size, is_dir=False):
+    length = 33 + len(ident) + (1 - len(ident) % 2)
+    record = struct.pack('<BB', length, 0)
+    record += _both32(extent) + _both32(size)
+    # recording date is left unset so that images are reproducible
+    record += b'\0' * 7
+    record += struct.pack('<BBB', 2 if is_dir else 0, 0, 0)
+    record += _both16(1)
+    record += struct.pack('<B', len(ident)) + ident
+    return _pad(record, length)
+
+
+def _path_table(extent, big_endian):
+    fmt = '>BBIH' if big_endian else '<BBIH'
+    return struct.pack(fmt, 1, 0, extent, 1) + b'\0\0'
+
+
+def _volume_descriptor(vd_type, volume_id, total_sectors, root_record,
+                       path_table_size, l_table, m_table, joliet):
+    vd = struct.pack('<B', vd_type) + b'CD001\x01\0'
+    vd += _text('', 32, joliet)
+    vd += _text(volume_id, 32, joliet)
+    vd += b'\0' * 8
+    vd += _both32(total_sectors)
+    if joliet:
+        # UCS-2 level 3 escape sequence
+        vd += _pad(b'%/E', 32)
+    else:
+        vd += b'\0' * 32
+
+    vd += _both16(1) + _both16(1) + _both16(SECTOR_SIZE)
+    vd += _both32(path_table_size)
+    vd += struct.pack('<II', l_table, 0)
+    vd += struct.pack('>II', m_table, 0)
+    vd += root_record
+    vd += _text('', 128, joliet) * 4
+    vd += _text('', 37, joliet) * 3
+    vd += (b'0' * 16 + b'\0') * 4
+    vd += b'\x01\0'
+    return _pad(vd, SECTOR_SIZE)
+
+
+def _sectors(size):
+    return max(1, -(-size // SECTOR_SIZE))
+
+
+def make_iso(path, files, volume_id='cidata'):
+    names = sorted(files)
+    # system area, pvd, svd, terminator, two pairs of path tables and the
+    # root directory of each hierarchy.
+    root_extent = 23
+    joliet_root_extent = 24
+    extent = 25
+    extents = {}
+    for name in names:
+        extents[name] = extent
+        extent += _sectors(len(files[name]))
+
+    total_sectors = extent
+    taken = set()
+    dirs = {}
+    for joliet, dir_extent in ((False, root_extent),
+                               (True, joliet_root_extent)):
+        records = _dir_record(b'\0', dir_extent, SECTOR_SIZE, True)
+        records += _dir_record(b'\x01', dir_extent, SECTOR_SIZE, True)
+        for name in names:
+            if joliet:
+                ident = name.encode('utf-16-be')
+            else:
+                ident = _primary_name(name, taken).encode('ascii')
+
+            records += _dir_record(ident, extents[name], len(files[name]))
+
+        if len(records) > SECTOR_SIZE:
+            raise Exception("Too many files for seed image")
+
+        dirs[joliet] = _pad(records, SECTOR_SIZE)
+
+    path_table_size = len(_path_table(0, False))
+    with open(path, 'wb') as fd:
+        fd.write(b'\0' * SECTOR_SIZE * 16)
+        fd.write(_volume_descriptor(1, volume_id, total_sectors,
+                                    _dir_record(b'\0', root_extent,
+                                                SECTOR_SIZE, True),
+                                    path_table_size, 19, 20, False))
+        fd.write(_volume_descriptor(2, volume_id, total_sectors,
+                                    _dir_record(b'\0', joliet_root_extent,
+                                                SECTOR_SIZE, True),
+                                    path_table_size, 21, 22, True))
+        fd.write(_pad(b'\xffCD001\x01', SECTOR_SIZE))
+        for extent in (root_extent, joliet_root_extent):
+            fd.write(_pad(_path_table(extent, False), SECTOR_SIZE))
+            fd.write(_pad(_path_table(extent, True), SECTOR_SIZE))
+
+        fd.write(dirs[False])
+        fd.write(dirs[True])
+        for name in names:
+            fd.write(_pad(files[name],
+                          _sectors(len(files[name])) * SECTOR_SIZE))
+
+
+def get_user_data_type(content):
+    for prefix, subtype in USER_DATA_TYPES:
+        if content.startswith(prefix):
+            return subtype
+
+    return 'plain'
+
+
+def mime_part(content, filename, subtype=None):
+    try:
+        content.encode('ascii')
+        charset = 'us-ascii'
+    except UnicodeEncodeError:
+        charset = 'utf-8'
+
+    part = MIMEText(content, subtype or get_user_data_type(content), charset)
+    part.add_header('Content-Disposition', 'attachment', filename=filename)
+    return part.as_string()
+
+
+def mime_multipart(parts, boundary):
+    msg = ['Content-Type: multipart/mixed; boundary="{}"'.format(boundary),
+           'MIME-Version: 1.0', '']
+    for part in parts:
+        msg += ['--{}'.format(boundary), part]
+
+    msg += ['--{}--'.format(boundary), '']
+    return '\n'.join(msg)
+
+
+def _read(path):
+    with open(path) as fd:
+        return fd.read()
+
+
+class SeedBuilder():
+    def __init__(self, ctxt, snap_dict=None, init_script=None,
+                 user_data=None, meta_data=None, net_config=None):
+        golden = dict(ctxt, name=NAME_PLACEHOLDER)
+        if user_data:
+            self.user_data = _read(user_data)
+        else:
+            self.user_data = render('user-data', golden)
+
+        if meta_data:
+            self.meta_data = _read(meta_data)
+        else:
+            self.meta_data = render('meta-data', golden)
+
+        self.net_config = None
+        if net_config:
+            self.net_config = _read(net_config)
+
+        self.parts = []
+        if (snap_dict and any(snap_dict.values())) or ctxt.get('baked_snaps'):
+            script = render('snap_install.sh', golden)
+            self.parts.append(mime_part(script, 'snap_install.sh',
+                                        'x-shellscript'))
+
+        if init_script:
+            self.parts.append(mime_part(_read(init_script),
+                                        os.path.basename(init_script),
+                                        'x-shellscript'))
+
+        checksum = hashlib.sha256(self.user_data.encode('utf-8'))
+        for part in self.parts:
+            checksum.update(part.encode('utf-8'))
+
+        self.boundary = '=' * 15 + checksum.hexdigest()[:24] + '=='
+
+    def render(self, name):
+        user_data = self.user_data.replace(NAME_PLACEHOLDER, name)
+        if self.parts:
+            user_data = mime_multipart([mime_part(user_data, 'user-data')] +
+                                       self.parts, self.boundary)
+
+        files = {'user-data': user_data,
+                 'meta-data': self.meta_data.replace(NAME_PLACEHOLDER, name)}
+        if self.net_config:
+            files['network-config'] = self.net_config
+
+        return files
+
+    def build(self, name, dom_path, seed_path):
+        files = {}
+        for fname, content in self.render(name).items():
+            files[fname] = content.encode('utf-8')
+            with open(os.path.join(dom_path, fname), 'wb') as fd:
+                fd.write(files[fname])
+
+        make_iso(seed_path, files)
@@ -0,0 +1,125 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import time
+
+from basejmpr.image.store import reflink
+from basejmpr.profiler import PROFILER
+
+STRATEGIES = ['overlay', 'reflink', 'convert']
+PREALLOCATION_MODES = ['off', 'metadata', 'falloc', 'full']
+
+
+def _qcow2_options(preallocation=None, cluster_size=None):
+    opts = []
+    if preallocation:
+        opts.append('preallocation={}'.format(preallocation))
+
+    if cluster_size:
+        opts.append('cluster_size={}'.format(cluster_size))
+
+    if opts:
+        return ['-o', ','.join(opts)]
+
+    return []
+
+
+def create_overlay(img, size, backingfile=None, preallocation=None,
+                   cluster_size=None):
+    cmd = ['qemu-img', 'create', '-f', 'qcow2']
+    if backingfile:
+        cmd += ['-F', 'qcow2', '-b', backingfile]
+
+    cmd += _qcow2_options(preallocation, cluster_size)
+    PROFILER.check_call(cmd + [img, size])
+    return 'overlay'
+
+
+def create_reflink(img, size, backingfile):
+    try:
+        reflink(backingfile, img)
+        method = 'reflink'
+    except OSError as exc:
+        print("WARNING: unable to reflink '{}' ({}) - falling back to "
+              "full copy".format(backingfile, exc))
+        PROFILER.check_call(['cp', '--sparse=always', backingfile, img])
+        method = 'copy'
+
+    PROFILER.check_call(['qemu-img', 'resize', '-q', img, size])
+    return method
+
+
+def create_convert(img, size, backingfile, preallocation=None,
+                   cluster_size=None):
+    cmd = ['qemu-img', 'convert', '-q', '-f', 'qcow2', '-O', 'qcow2']
+    cmd += _qcow2_options(preallocation, cluster_size)
+    PROFILER.check_call(cmd + [backingfile, img])
+    PROFILER.check_call(['qemu-img', 'resize', '-q', img, size])
+    return 'convert'
+
+
+def check_root_disk_options(strategy, preallocation=None, backingfile=True,
+                            cluster_size=None):
+    strategy = strategy or 'overlay'
+    if strategy not in STRATEGIES:
+        raise Exception("Unknown root disk strategy '{}'".format(strategy))
+
+    if not backingfile and strategy != 'overlay':
+        raise Exception("Root disk strategy '{}' copies the backing file so "
+                        "it cannot be used without one".format(strategy))
+
+    # qemu-img refuses to preallocate an overlay unless extended_l2 is used
+    # and reflink copies are never preallocated.
+    if preallocation and backingfile and strategy != 'convert':
+        raise Exception("Preallocation is only supported by the convert "
+                        "root disk strategy or without a backing file")
+
+    if cluster_size and strategy == 'reflink':
+        raise Exception("Cluster size is not supported by the reflink root "
+                        "disk strategy")
+
+
+def create_root_disk(ctxt):
+    img = ctxt['img_path']
+    size = ctxt['root_size']
+    backingfile = ctxt.get('backingfile')
+    strategy = ctxt.get('root_strategy') or 'overlay'
+    check_root_disk_options(strategy, ctxt.get('preallocation'),
+                            bool(backingfile), ctxt.get('cluster_size'))
+    if os.path.exists(img):
+        os.remove(img)
+
+    start = time.monotonic()
+    if strategy == 'overlay':
+        method = create_overlay(img, size, backingfile,
+                                ctxt.get('preallocation'),
+                                ctxt.get('cluster_size'))
+    elif strategy == 'reflink':
+        method = create_reflink(img, size, backingfile)
+    else:
+        method = create_convert(img, size, backingfile,
+                                ctxt.get('preallocation'),
+                                ctxt.get('cluster_size'))
+
+    elapsed = time.monotonic() - start
+    print("INFO: root disk for '{}' created using {} in {:.2f}s".
+          format(ctxt['name'], method, elapsed))
+    return method, elapsed
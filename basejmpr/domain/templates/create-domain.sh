@@ -1,12 +1,16 @@
 #!/bin/bash -eux
 img={{name}}.img
-virsh destroy {{name}} || true
-virsh undefine {{name}} || true
+virsh="virsh{% if libvirt_uri %} -c {{libvirt_uri}}{% endif %}"
+{%- if define_domain %}
+$virsh destroy {{name}} || true
+$virsh undefine {{name}} || true
+{%- endif %}
+{%- if virt_install %}
 
 virt-install \
     --name={{name}} \
     --osinfo=ubuntu{{series}} \
-    --connect=qemu:///system --ram={{mem}} --cpu host --vcpus={{vcpus}} --hvm \
+    --connect={{libvirt_uri or "qemu:///system"}} --ram={{mem}} --cpu host --vcpus={{vcpus}} --hvm \
     --virt-type=kvm \
     --pxe --boot {{boot_order}} \
     --graphics vnc --noautoconsole --os-type=linux --accelerate \
@@ -21,5 +25,8 @@ virt-install \
     --network=network={{network}},model=virtio \
     {%- endfor %}
     --print-xml 2 > domain.xml
+{%- endif %}
+{%- if define_domain %}
 
-virsh define domain.xml
+$virsh define domain.xml
+{%- endif %}
@@ -1,4 +1,8 @@
 #!/bin/bash -eu
+{%- for snap in baked_snaps %}
+sudo snap ack {{guest_snap_dir}}/{{snap['assert']}}
+sudo snap install {% if snap['classic'] %}--classic {% endif %}{{guest_snap_dir}}/{{snap['file']}}
+{%- endfor %}
 {%- if classic_snaps %}
 sudo snap install --classic {{classic_snaps}}
 {%- elif stable_snaps %}
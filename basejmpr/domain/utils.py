@@ -18,50 +18,174 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import functools
 import os
-import re
 import shutil
-import subprocess
-import tempfile
+import time
 import uuid
-
-
-from jinja2 import Environment, PackageLoader
-
-
-def render_templates(ctxt, dom_path, dom_templates, local_path,
-                     local_templates):
-    env = Environment()
-    env.loader = PackageLoader('basejmpr.domain', 'templates')
+from concurrent.futures import ThreadPoolExecutor
+
+from basejmpr.domain.artifacts import (
+    get_artifacts_key,
+    prune_artifacts,
+    save_artifacts,
+    verify_artifacts,
+)
+from basejmpr.domain.backend import get_backend
+from basejmpr.domain.domxml import generate_domain_xml
+from basejmpr.domain.pool import get_spec
+from basejmpr.domain.render import get_template, render
+from basejmpr.domain.seed import SeedBuilder
+from basejmpr.domain.storage import create_root_disk
+from basejmpr.image.bake import GUEST_SNAP_DIR, split_snaps
+from basejmpr.profiler import PROFILER
+
+
+def render_templates(ctxt, dom_path, dom_templates):
     # Expect to fail if exists
     os.makedirs(dom_path)
     for t in dom_templates:
-        rt = env.get_template(t).render(**ctxt)
+        rt = render(t, ctxt)
         with open(os.path.join(dom_path, t), 'w') as fd:
             fd.write(rt)
 
-    for t in local_templates:
-        rt = env.get_template(t).render(**ctxt)
-        with open(os.path.join(local_path, t), 'w') as fd:
-            fd.write(rt)
 
+def provision_domains(domains, create_fn, parallel=1):
+    def _run(dom):
+        start = time.monotonic()
+        result = {'name': dom['name'], 'ok': True, 'error': None,
+                  'timings': {}}
+        try:
+            result['timings'] = create_fn(dom) or {}
+        except Exception as exc:
+            result['ok'] = False
+            result['error'] = exc
 
-def domain_exists(name):
-    out = subprocess.check_output(['virsh', 'list', '--all']).decode('utf-8')
-    key = re.compile(r' %s ' % name)
-    result = re.search(key, out)
-    return result is not None and result.group(0).strip() == name
+        result['elapsed'] = time.monotonic() - start
+        return result
 
+    workers = max(1, min(parallel or 1, len(domains) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run, domains))
+
+
+def display_provision_summary(results, elapsed, parallel=1):
+    print("\nINFO: provisioning summary (parallel={}):".format(parallel))
+    for result in results:
+        if result['ok']:
+            status = 'ok'
+        else:
+            status = 'FAILED - {}'.format(result['error'])
+
+        root_disk = ''
+        if 'root_disk' in result['timings']:
+            root_disk = ' (root disk {} {:.2f}s)'.format(
+                result['timings']['root_disk_method'],
+                result['timings']['root_disk'])
+
+        if result['timings'].get('artifacts') == 'cached':
+            root_disk += ' (artifacts unchanged)'
+
+        print("  {}: {:.2f}s{} {}".format(result['name'], result['elapsed'],
+                                          root_disk, status))
+
+    success = len([r for r in results if r['ok']])
+    print("INFO: {}/{} domain(s) created in {:.2f}s".
+          format(success, len(results), elapsed))
+    changed = [r['name'] for r in results
+               if r['timings'].get('artifacts') == 'rendered']
+    print("INFO: artifacts changed for {}/{} domain(s){}".
+          format(len(changed), len(results),
+                 ': {}'.format(', '.join(changed)) if changed else ''))
+
+
+def render_artifacts(dom):
+    dom_path = dom['path']
+    with PROFILER.phase('render_templates'):
+        render_templates(dom['ctxt'], dom_path, dom['templates'])
+
+    if dom.get('seed_builder'):
+        with PROFILER.phase('build_seed'):
+            dom['seed_builder'].build(dom['name'], dom_path,
+                                      dom['ctxt']['seed_path'])
+
+    os.chmod(os.path.join(dom_path, 'create-domain.sh'), 0o0755)
+    os.chmod(os.path.join(dom_path, 'create-storage.sh'), 0o0755)
+    if not dom['ctxt']['virt_install']:
+        with PROFILER.phase('generate_domain_xml'):
+            xml = generate_domain_xml(dom['ctxt'])
+
+        with open(os.path.join(dom_path, 'domain.xml'), 'w') as fd:
+            fd.write(xml)
+
+
+def create_domain(dom, backend=None, skip_cleanup=False):
+    with PROFILER.domain(dom['name']):
+        return _create_domain(dom, backend=backend, skip_cleanup=skip_cleanup)
+
+
+def _create_domain(dom, backend=None, skip_cleanup=False):
+    dom_name = dom['name']
+    dom_path = dom['path']
+    timings = {}
+    try:
+        if dom.get('reset') == 'prune':
+            prune_artifacts(dom_path)
+        elif dom.get('reset') == 'rmtree':
+            shutil.rmtree(dom_path)
+
+        if dom.get('cached'):
+            timings['artifacts'] = 'cached'
+        else:
+            render_artifacts(dom)
+            timings['artifacts'] = 'rendered'
+            rendered = os.listdir(dom_path)
+
+        start = time.monotonic()
+        with PROFILER.phase('root_disk'):
+            if dom.get('pool') and dom['pool'].take(dom['ctxt'], dom_path):
+                timings['root_disk'] = time.monotonic() - start
+                timings['root_disk_method'] = 'warm pool'
+            else:
+                method, elapsed = create_root_disk(dom['ctxt'])
+                timings['root_disk'] = elapsed
+                timings['root_disk_method'] = method
+                if dom['ctxt'].get('disks'):
+                    PROFILER.check_call(['./create-storage.sh'],
+                                        cwd=dom_path)
+
+        if dom['ctxt']['virt_install'] or dom['ctxt']['define_domain']:
+            PROFILER.check_call(['./create-domain.sh'], cwd=dom_path)
+
+        if backend and backend.defines_domains:
+            with open(os.path.join(dom_path, 'domain.xml')) as fd:
+                xml = fd.read()
+
+            with PROFILER.phase('define_domain'):
+                backend.define(dom_name, xml)
+
+        if not dom.get('cached'):
+            save_artifacts(dom_path, dom['key'], rendered)
+    except Exception as exc:
+        print("\nERROR: domain '{}' create unsuccessful: deleting "
+              "{} - {}".format(dom_name, dom_path, exc))
+        if not skip_cleanup and os.path.isdir(dom_path):
+            shutil.rmtree(dom_path)
+
+        raise
+
+    return timings
 
-def create_domains(root, base_root, revision, series, num_domains,
-                   base_revisions, domain_name_prefix, root_disk_size,
-                   ssh_lp_user, domain_memory, domain_vcpus, domain_boot_order,
-                   networks, domain_disks, domain_apt_proxy,
-                   domain_init_script, domain_user_data, domain_meta_data,
-                   domain_net_config, domain_disk_bus,
-                   force=False, skip_seed=False, skip_backingfile=False,
-                   skip_cleanup=False, nic_prefix=None, snap_dict=None):
 
+def get_domain_names(prefix, num_domains):
+    num_domains = num_domains or 1
+    if num_domains == 1:
+        return [prefix]
+
+    return ['{}{}'.format(prefix, n) for n in range(num_domains)]
+
+
+def get_revision(base_revisions, revision, series):
     rev = None
     if revision:
         rev = revision
@@ -70,45 +194,51 @@ def create_domains(root, base_root, revision, series, num_domains,
                       reverse=True)
         for r in revs:
             r = str(r)
-            _series = base_revisions[r]['targets'][0].partition('-')[0]
-            if series and series == _series:
+            if series and series == base_revisions[r]['series']:
                 rev = r
                 break
 
     if not rev:
         raise Exception("No revision found for series '{}'".format(series))
 
+    if rev not in base_revisions:
+        raise Exception("Revision '{}' does not exist".format(rev))
+
+    return rev
+
+
+def plan_domains(root, base_root, revision, series, num_domains,
+                 base_revisions, domain_name_prefix, root_disk_size,
+                 ssh_lp_user, domain_memory, domain_vcpus, domain_boot_order,
+                 networks, domain_disks, domain_apt_proxy,
+                 domain_init_script, domain_user_data, domain_meta_data,
+                 domain_net_config, domain_disk_bus,
+                 force=False, skip_seed=False, skip_backingfile=False,
+                 nic_prefix=None, snap_dict=None, existing=None,
+                 define_domain=True, use_virt_install=False,
+                 root_disk_strategy='overlay', preallocation=None,
+                 cluster_size=None, warm_pool=None, libvirt_uri=None):
+    rev = get_revision(base_revisions, revision, series)
     backingfile = os.path.join(base_root, rev,
                                base_revisions[rev]['files'][0])
 
-    if not num_domains:
-        num_domains = 1
-
+    snap_dict = snap_dict or {}
+    baked_snaps = base_revisions[rev].get('snaps') or []
+    if baked_snaps:
+        # Snaps already staged in a baked revision are installed from the
+        # image rather than the store.
+        baked = set(s['name'] for s in baked_snaps)
+        snap_dict = {k: ','.join(n for n in split_snaps(v) if n not in baked)
+                     or None for k, v in snap_dict.items()}
+
+    existing = existing or set()
+    domains = []
     name = domain_name_prefix or str(uuid.uuid4())
-    for n in range(num_domains):
-        if num_domains > 1:
-            dom_name = '{}{}'.format(name, n)
-        else:
-            dom_name = name
-
+    for dom_name in get_domain_names(name, num_domains):
         dom_path = os.path.join(root, dom_name)
         imgpath = os.path.join(dom_path, '{}.img'.format(dom_name))
         seedpath = os.path.join(dom_path, '{}-seed.img'.format(dom_name))
         print("INFO: creating domain '{}'".format(dom_name))
-        if os.path.isdir(dom_path):
-            if not force:
-                print("WARNING: domain path '{}' already exists - skipping "
-                      "create".format(dom_path))
-                continue
-
-            print("INFO: domain path '{}' already exists - "
-                  "overwriting".format(dom_path))
-            shutil.rmtree(dom_path)
-        elif domain_exists(dom_name) and not force:
-            print("WARNING: domain '{}' already exists - skipping "
-                  "create".format(dom_name))
-            continue
-
         ctxt = {'name': dom_name,
                 'series': series,
                 'ssh_user': ssh_lp_user,
@@ -123,7 +253,18 @@ def create_domains(root, base_root, revision, series, num_domains,
                 'stable_snaps': snap_dict.get('stable'),
                 'networks': networks.split(','),
                 'apt_proxy': domain_apt_proxy,
-                'nic_prefix': nic_prefix}
+                'nic_prefix': nic_prefix,
+                'define_domain': define_domain,
+                'virt_install': use_virt_install,
+                'root_strategy': root_disk_strategy,
+                'preallocation': preallocation,
+                'cluster_size': cluster_size,
+                'libvirt_uri': libvirt_uri,
+                # Only revisions baked with a dist-upgrade are up to date.
+                'upgraded': bool(base_revisions[rev].get('baked_from') and
+                                 base_revisions[rev].get('dist_upgrade')),
+                'baked_snaps': baked_snaps,
+                'guest_snap_dir': GUEST_SNAP_DIR}
 
         if skip_backingfile:
             del ctxt['backingfile']
@@ -140,70 +281,130 @@ def create_domains(root, base_root, revision, series, num_domains,
 
             ctxt['disks'] = disks
 
-        local_templates = ['snap_install.sh']
-        dom_templates = ['create-domain.sh', 'create-storage.sh']
-        if not skip_seed:
-            if not domain_user_data:
-                dom_templates += ['user-data']
+        key = get_artifacts_key(ctxt, [domain_init_script, domain_user_data,
+                                       domain_meta_data, domain_net_config])
+        # Existing domains are only reset by create_domain so that nothing
+        # is destroyed until the domain is actually being recreated.
+        reset = None
+        if os.path.isdir(dom_path):
+            if not force:
+                print("WARNING: domain path '{}' already exists - skipping "
+                      "create".format(dom_path))
+                continue
 
-            if domain_meta_data:
-                ctxt['network_config'] = 'meta-data'
-            elif domain_net_config:
-                ctxt['network_config'] = '--network-config network-config'
+            if verify_artifacts(dom_path, key):
+                print("INFO: domain path '{}' already exists - artifacts "
+                      "unchanged".format(dom_path))
+                reset = 'prune'
             else:
-                ctxt['network_config'] = 'meta-data'
-                dom_templates += ['meta-data']
+                print("INFO: domain path '{}' already exists - "
+                      "overwriting".format(dom_path))
+                reset = 'rmtree'
+        elif dom_name in existing and not force:
+            print("WARNING: domain '{}' already exists - skipping "
+                  "create".format(dom_name))
+            continue
+
+        domains.append({'name': dom_name, 'path': dom_path, 'ctxt': ctxt,
+                        'templates': ['create-domain.sh',
+                                      'create-storage.sh'],
+                        'pool': warm_pool, 'key': key,
+                        'cached': reset == 'prune', 'reset': reset})
+
+    if not skip_seed and not all(d['cached'] for d in domains):
+        seed_builder = SeedBuilder(domains[0]['ctxt'], snap_dict=snap_dict,
+                                   init_script=domain_init_script,
+                                   user_data=domain_user_data,
+                                   meta_data=domain_meta_data,
+                                   net_config=domain_net_config)
+        for dom in domains:
+            dom['seed_builder'] = seed_builder
+
+    return domains
+
+
+def provision(domains, backend, parallel=1, skip_cleanup=False,
+              scheduler=None):
+    # Admission must happen before anything existing is touched which is
+    # guaranteed since domains are only reset by create_domain.
+    skipped = []
+    if scheduler:
+        with PROFILER.phase('schedule'):
+            domains, parallel, skipped = scheduler.schedule(domains,
+                                                            parallel)
+
+    if not domains:
+        if skipped:
+            raise Exception("Skipped {} domain(s) that exceed host "
+                            "capacity: {}".format(len(skipped),
+                                                  ', '.join(skipped)))
+
+        return []
+
+    # Compile everything up front so that workers only render.
+    with PROFILER.phase('compile_templates'):
+        for t in ['create-domain.sh', 'create-storage.sh', 'user-data',
+                  'meta-data', 'snap_install.sh']:
+            get_template(t)
+
+    create_fn = functools.partial(create_domain, backend=backend,
+                                  skip_cleanup=skip_cleanup)
+    start = time.monotonic()
+    results = provision_domains(domains, create_fn, parallel)
+    display_provision_summary(results, time.monotonic() - start, parallel)
+    refills = {}
+    for dom in domains:
+        if dom.get('pool'):
+            spec = get_spec(dom['ctxt'])
+            refills[dom['pool'].key_path(spec)] = (dom['pool'], spec)
+
+    for pool, spec in refills.values():
+        print("INFO: refilling warm pool {} in the background".
+              format(pool.key_path(spec)))
+        pool.refill_async(spec)
+
+    failed = [r['name'] for r in results if not r['ok']]
+    if failed:
+        raise Exception("Failed to create {} domain(s): {}".
+                        format(len(failed), ', '.join(failed)))
+
+    if skipped:
+        raise Exception("Skipped {} domain(s) that exceed host capacity: "
+                        "{}".format(len(skipped), ', '.join(skipped)))
+
+    return results
 
-        tmpdir = tempfile.mkdtemp()
-        try:
-            render_templates(ctxt, dom_path, dom_templates, tmpdir,
-                             local_templates)
-
-            if not skip_seed:
-                for _input, tgt in {domain_user_data: 'user-data',
-                                    domain_meta_data: 'meta-data'}.items():
-                    if _input:
-                        tgt = os.path.join(dom_path, tgt)
-                        shutil.copy(_input, tgt)
-
-                write_multipart = False
-                cmd = ['write-mime-multipart',
-                       '--output={}/user-data.tmp'.format(tmpdir),
-                       '{}/user-data'.format(dom_path)]
-                if any(snap_dict.values()):
-                    write_multipart = True
-                    cmd.append('{}/snap_install.sh:text/x-shellscript'
-                               .format(tmpdir))
-
-                if domain_init_script:
-                    write_multipart = True
-                    cmd.append('{}:text/x-shellscript'
-                               .format(domain_init_script))
-
-                if write_multipart:
-                    subprocess.check_output(cmd)
-                    shutil.copy(os.path.join(tmpdir, 'user-data.tmp'),
-                                os.path.join(dom_path, 'user-data'))
-
-                if domain_net_config:
-                    shutil.copy(domain_net_config,
-                                os.path.join(dom_path, 'network-config'))
-        except Exception:
-            if not skip_cleanup:
-                shutil.rmtree(tmpdir)
-
-            raise
-
-        os.chmod(os.path.join(dom_path, 'create-domain.sh'), 0o0755)
-        os.chmod(os.path.join(dom_path, 'create-storage.sh'), 0o0755)
-        try:
-            os.chdir(dom_path)
-            subprocess.check_call(['./create-storage.sh'])
-            subprocess.check_call(['./create-domain.sh'])
-        except Exception as exc:
-            print("\nERROR: domain '{}' create unsuccessful: deleting "
-                  "{} - {}".format(dom_name, dom_path, exc))
-            if not skip_cleanup:
-                shutil.rmtree(dom_path)
 
-            raise
+def create_domains(root, base_root, revision, series, num_domains,
+                   base_revisions, domain_name_prefix, root_disk_size,
+                   ssh_lp_user, domain_memory, domain_vcpus, domain_boot_order,
+                   networks, domain_disks, domain_apt_proxy,
+                   domain_init_script, domain_user_data, domain_meta_data,
+                   domain_net_config, domain_disk_bus,
+                   force=False, skip_seed=False, skip_backingfile=False,
+                   skip_cleanup=False, nic_prefix=None, snap_dict=None,
+                   parallel=1, backend=None, use_virt_install=False,
+                   root_disk_strategy='overlay', preallocation=None,
+                   cluster_size=None, warm_pool=None, scheduler=None):
+    backend = backend or get_backend()
+    with PROFILER.phase('list_domains'):
+        existing = backend.list_domains()
+
+    with PROFILER.phase('plan_domains'):
+        domains = plan_domains(
+            root, base_root, revision, series, num_domains, base_revisions,
+            domain_name_prefix, root_disk_size, ssh_lp_user, domain_memory,
+            domain_vcpus, domain_boot_order, networks, domain_disks,
+            domain_apt_proxy, domain_init_script, domain_user_data,
+            domain_meta_data, domain_net_config, domain_disk_bus,
+            force=force, skip_seed=skip_seed,
+            skip_backingfile=skip_backingfile, nic_prefix=nic_prefix,
+            snap_dict=snap_dict, existing=existing,
+            define_domain=not backend.defines_domains,
+            use_virt_install=use_virt_install,
+            root_disk_strategy=root_disk_strategy,
+            preallocation=preallocation, cluster_size=cluster_size,
+            warm_pool=warm_pool, libvirt_uri=backend.uri)
+
+    return provision(domains, backend, parallel=parallel,
+                     skip_cleanup=skip_cleanup, scheduler=scheduler)
@@ -0,0 +1,113 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import glob
+import os
+import shutil
+
+from basejmpr.image.catalogue import get_catalogue, write_revision_meta
+from basejmpr.image.store import sha256sum
+from basejmpr.profiler import PROFILER
+
+# Where snaps are staged inside baked images.
+GUEST_SNAP_DIR = '/var/lib/basejmpr/snaps'
+BAKE_TOOLS = ['snap', 'virt-customize']
+
+
+def split_snaps(snaps):
+    if not snaps:
+        return []
+
+    return [s.strip() for s in snaps.split(',') if s.strip()]
+
+
+def download_snaps(snap_dir, snap_dict):
+    os.makedirs(snap_dir)
+    staged = []
+    for classic, names in [(False, snap_dict.get('stable')),
+                           (True, snap_dict.get('classic'))]:
+        for name in split_snaps(names):
+            print("INFO: downloading snap '{}'".format(name))
+            PROFILER.check_call(['snap', 'download',
+                                 '--target-directory={}'.format(snap_dir),
+                                 name])
+            found = sorted(glob.glob(os.path.join(snap_dir,
+                                                  '{}_*.snap'.format(name))))
+            if not found:
+                raise Exception("Unable to find downloaded snap '{}'".
+                                format(name))
+
+            snap = os.path.basename(found[-1])
+            staged.append({'name': name, 'classic': classic, 'file': snap,
+                           'assert': '{}.assert'.format(snap[:-5])})
+
+    return staged
+
+
+def customize(img, snap_dir=None, dist_upgrade=True):
+    cmd = ['virt-customize', '-q', '-a', img]
+    if dist_upgrade:
+        cmd += ['--run-command',
+                'apt-get update && DEBIAN_FRONTEND=noninteractive '
+                'apt-get -y -o Dpkg::Options::=--force-confold dist-upgrade',
+                '--run-command', 'apt-get clean']
+
+    if snap_dir:
+        cmd += ['--mkdir', os.path.dirname(GUEST_SNAP_DIR),
+                '--copy-in', '{}:{}'.format(snap_dir,
+                                            os.path.dirname(GUEST_SNAP_DIR))]
+
+    PROFILER.check_call(cmd)
+
+
+def bake_revision(basedir, rev, snap_dict=None, dist_upgrade=True):
+    missing = [t for t in BAKE_TOOLS if not shutil.which(t)]
+    if missing:
+        raise Exception("Baking a revision requires {}".
+                        format(', '.join(missing)))
+
+    catalogue = get_catalogue(basedir)
+    base = catalogue.get(rev)
+    newrev = str(max(int(r) for r in catalogue.names()) + 1)
+    newpath = os.path.join(basedir, newrev)
+    print("INFO: baking revision {} from revision {}".format(newrev, rev))
+    with catalogue.building(newrev):
+        snaps = []
+        snap_dir = None
+        if snap_dict and any(snap_dict.values()):
+            snap_dir = os.path.join(newpath, 'snaps')
+            snaps = download_snaps(snap_dir, snap_dict)
+
+        # The image is modified in place so it must never be a hardlink to
+        # the base revision or the store.
+        target = os.path.join('targets', base['targets'][0])
+        img = os.path.join(newpath, target)
+        PROFILER.check_call(['cp', '--sparse=always', '--reflink=auto',
+                             os.path.join(basedir, rev, target), img])
+        customize(img, snap_dir=snap_dir, dist_upgrade=dist_upgrade)
+
+        sha256 = sha256sum(img)
+        write_revision_meta(newpath, base['series'], sha256,
+                            os.path.getsize(img), baked_from=rev,
+                            dist_upgrade=dist_upgrade, snaps=snaps)
+        os.symlink(target, os.path.join(newpath, sha256))
+
+    print("INFO: baked revision {} ({})".format(newrev, sha256))
+    return newrev
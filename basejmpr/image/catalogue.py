@@ -0,0 +1,139 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import json
+import os
+import shutil
+import time
+
+META_FILE = os.path.join('meta', 'revision.json')
+_CATALOGUES = {}
+
+
+def write_revision_meta(rdir, series, sha256, size, created=None, **extra):
+    meta = dict(extra, series=series, sha256=sha256, size=size,
+                created=created or time.time())
+    tmp = os.path.join(rdir, '{}.tmp'.format(META_FILE))
+    with open(tmp, 'w') as fd:
+        json.dump(meta, fd)
+
+    os.rename(tmp, os.path.join(rdir, META_FILE))
+    return meta
+
+
+def read_revision_meta(rdir):
+    try:
+        with open(os.path.join(rdir, META_FILE)) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_revision(rdir):
+    files = [c for c in os.listdir(rdir)
+             if os.path.islink(os.path.join(rdir, c))]
+    targets = os.listdir(os.path.join(rdir, 'targets'))
+    meta = read_revision_meta(rdir)
+    if not meta:
+        # Revisions created before metadata was recorded.
+        meta = {'series': None, 'sha256': None, 'size': None,
+                'created': os.stat(rdir).st_mtime}
+        if targets:
+            meta['series'] = targets[0].partition('-')[0]
+
+        if files:
+            meta['sha256'] = files[0]
+
+    return dict(meta, files=files, targets=targets)
+
+
+class RevisionCatalogue():
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self._names = None
+        self._mtime = None
+        self._entries = {}
+
+    def _stat_key(self, rdir):
+        key = [os.stat(rdir).st_mtime_ns,
+               os.stat(os.path.join(rdir, 'targets')).st_mtime_ns]
+        try:
+            meta = os.stat(os.path.join(rdir, META_FILE))
+            key += [meta.st_mtime_ns, meta.st_size, meta.st_ino]
+        except FileNotFoundError:
+            pass
+
+        return key
+
+    def names(self):
+        try:
+            mtime = os.stat(self.basedir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        if self._names is None or mtime != self._mtime:
+            self._names = [r for r in os.listdir(self.basedir)
+                           if not r.startswith('.')]
+            self._mtime = mtime
+            for name in set(self._entries) - set(self._names):
+                del self._entries[name]
+
+        return self._names
+
+    def get(self, rev):
+        rdir = os.path.join(self.basedir, rev)
+        key = self._stat_key(rdir)
+        cached = self._entries.get(rev)
+        if cached is None or cached[0] != key:
+            cached = (key, load_revision(rdir))
+            self._entries[rev] = cached
+
+        return cached[1]
+
+    def revisions(self, rev=None):
+        return {r: self.get(r) for r in self.names() if not rev or rev == r}
+
+    @contextlib.contextmanager
+    def building(self, rev):
+        rdir = os.path.join(self.basedir, rev)
+        os.makedirs(os.path.join(rdir, 'meta'))
+        os.makedirs(os.path.join(rdir, 'targets'))
+        try:
+            yield rdir
+        except Exception:
+            shutil.rmtree(rdir)
+            raise
+        finally:
+            # Entries may have been cached while the revision was being built.
+            self.invalidate()
+
+    def invalidate(self):
+        self._names = None
+        self._entries = {}
+
+
+def get_catalogue(basedir):
+    basedir = os.path.realpath(basedir)
+    if basedir not in _CATALOGUES:
+        _CATALOGUES[basedir] = RevisionCatalogue(basedir)
+
+    return _CATALOGUES[basedir]
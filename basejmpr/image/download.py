@@ -0,0 +1,125 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import os
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from basejmpr.image.store import sha256sum
+
+DEFAULT_BASE_URL = 'https://cloud-images.ubuntu.com'
+DOWNLOADS_DIR = '.downloads'
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+
+def parse_sha256sums(path):
+    sums = {}
+    with open(path) as fd:
+        for line in fd:
+            fields = line.split()
+            if len(fields) == 2:
+                sums[fields[1].lstrip('*')] = fields[0]
+
+    return sums
+
+
+def fetch(url, out):
+    tmp = '{}.tmp'.format(out)
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as resp:
+        with open(tmp, 'wb') as fd:
+            for chunk in iter(lambda: resp.read(CHUNK_SIZE), b''):
+                fd.write(chunk)
+
+    os.replace(tmp, out)
+
+
+def fetch_all(items):
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        futures = [executor.submit(fetch, url, out) for url, out in items]
+
+    for future in futures:
+        future.result()
+
+
+def _open_range(url, offset):
+    req = urllib.request.Request(url)
+    if offset:
+        req.add_header('Range', 'bytes={}-'.format(offset))
+
+    try:
+        return urllib.request.urlopen(req, timeout=TIMEOUT)
+    except urllib.error.HTTPError as exc:
+        # Requested range starts at the end of the file i.e. the partial
+        # download is already complete.
+        if offset and exc.code == 416:
+            return None
+
+        raise
+
+
+def download(url, out, partial, sha256=None):
+    checksum = hashlib.sha256()
+    offset = 0
+    if os.path.exists(partial):
+        offset = os.path.getsize(partial)
+        sha256sum(partial, checksum, blocksize=CHUNK_SIZE)
+        print("INFO: resuming download of '{}' at {} bytes".
+              format(url, offset))
+    else:
+        print("INFO: downloading '{}'".format(url))
+
+    resp = _open_range(url, offset)
+    if resp:
+        with resp:
+            mode = 'ab'
+            content_range = resp.headers.get('Content-Range', '')
+            if offset and (resp.status != 206 or not
+                           content_range.startswith('bytes {}-'.
+                                                    format(offset))):
+                # Server does not support ranges so start again.
+                checksum = hashlib.sha256()
+                mode = 'wb'
+
+            received = 0
+            with open(partial, mode) as fd:
+                for chunk in iter(lambda: resp.read(CHUNK_SIZE), b''):
+                    checksum.update(chunk)
+                    fd.write(chunk)
+                    received += len(chunk)
+
+            length = resp.headers.get('Content-Length')
+            if length and received < int(length):
+                raise Exception("Incomplete download of '{}' - partial "
+                                "download kept in '{}'".format(url, partial))
+
+    digest = checksum.hexdigest()
+    if sha256 and digest != sha256:
+        os.remove(partial)
+        raise Exception("Checksum mismatch for '{}' - expected {} got {}".
+                        format(url, sha256, digest))
+
+    os.replace(partial, out)
+    return digest
@@ -0,0 +1,142 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from basejmpr.profiler import PROFILER
+
+TRASH_PREFIX = '.trash-'
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400,
+                  'w': 604800}
+
+
+def parse_duration(duration):
+    res = re.match(r'^(\d+)([smhdw]?)$', duration.strip().lower())
+    if not res:
+        raise Exception("Invalid duration '{}'".format(duration))
+
+    return int(res.group(1)) * DURATION_UNITS[res.group(2)]
+
+
+def plan_gc(revisions, c_by_rev, keep_last=1, keep_newer_than=None,
+            rebase=False, now=None, blobs=None):
+    now = now or time.time()
+    keep_last = max(1, keep_last)
+    by_series = {}
+    for rev in sorted(revisions, key=int, reverse=True):
+        by_series.setdefault(revisions[rev]['series'], []).append(rev)
+
+    plan = {'keep': {}, 'delete': [], 'rebase': [], 'prune': []}
+    for revs in by_series.values():
+        newest = revs[0]
+        for idx, rev in enumerate(revs):
+            consumers = c_by_rev.get(rev, [])
+            if idx < keep_last:
+                plan['keep'][rev] = 'one of last {}'.format(keep_last)
+            elif (keep_newer_than and
+                    now - revisions[rev]['created'] < keep_newer_than):
+                plan['keep'][rev] = 'too new'
+            elif consumers and not rebase:
+                plan['keep'][rev] = 'has {} consumer(s)'.format(len(consumers))
+            else:
+                for consumer in consumers:
+                    plan['rebase'].append({'image': consumer['image'],
+                                           'from': rev, 'to': newest})
+
+                plan['delete'].append(rev)
+
+    # Store blobs that no remaining revision uses.
+    in_use = set(f for rev in revisions if rev not in plan['delete']
+                 for f in revisions[rev]['files'])
+    plan['prune'] = sorted(b for b in blobs or [] if b not in in_use)
+    return plan
+
+
+def display_plan(plan, revisions):
+    print("GC plan:")
+    for rev in sorted(plan['keep'], key=int):
+        print("  keep {} ({}): {}".format(rev, revisions[rev]['series'],
+                                          plan['keep'][rev]))
+
+    for entry in plan['rebase']:
+        print("  rebase {image}: {from} -> {to}".format(**entry))
+
+    for rev in sorted(plan['delete'], key=int):
+        print("  delete {} ({})".format(rev, revisions[rev]['series']))
+
+    for sha256 in plan['prune']:
+        print("  prune {} from image store".format(sha256))
+
+    if not any(plan.values()):
+        print("  -")
+
+
+def rebase_image(img, backing_file):
+    # A safe (not -u) rebase only updates the backing file pointer once the
+    # data that differs has been copied so it can be interrupted at any time.
+    PROFILER.check_call(['qemu-img', 'rebase', '-q', '-f', 'qcow2',
+                         '-F', 'qcow2', '-b', backing_file, img])
+
+
+def run_rebases(basedir, revisions, rebases, parallel=1):
+    def _rebase(entry):
+        new = os.path.join(basedir, entry['to'],
+                           revisions[entry['to']]['files'][0])
+        start = time.monotonic()
+        try:
+            rebase_image(entry['image'], new)
+        except Exception as exc:
+            print("ERROR: failed to rebase '{}' onto revision {} - {}".
+                  format(entry['image'], entry['to'], exc))
+            return entry, False
+
+        print("INFO: rebased '{}' from revision {} to {} in {:.2f}s".
+              format(entry['image'], entry['from'], entry['to'],
+                     time.monotonic() - start))
+        return entry, True
+
+    if not rebases:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        return list(executor.map(_rebase, rebases))
+
+
+def purge_trash(basedir):
+    if not os.path.isdir(basedir):
+        return
+
+    for entry in os.listdir(basedir):
+        if entry.startswith(TRASH_PREFIX):
+            shutil.rmtree(os.path.join(basedir, entry))
+
+
+def delete_revision(basedir, rev):
+    # Renaming first means an interrupted delete never leaves a partial
+    # revision behind, just trash that is purged by the next run.
+    trash = os.path.join(basedir,
+                         '{}{}-{}'.format(TRASH_PREFIX, rev, uuid.uuid4()))
+    os.rename(os.path.join(basedir, rev), trash)
+    shutil.rmtree(trash)
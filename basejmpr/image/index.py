@@ -0,0 +1,127 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import sys
+import tempfile
+
+from basejmpr.image.qcow2 import read_header
+
+INDEX_FILE = '.consumer-index.json'
+INDEX_VERSION = 2
+
+
+def probe_backing_file(img_path):
+    try:
+        header = read_header(img_path)
+    except (OSError, ValueError):
+        return None
+
+    if not header:
+        return None
+
+    return header.backing_file
+
+
+class ConsumerIndex():
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.path = os.path.join(root_dir, INDEX_FILE)
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path) as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return
+
+        if data.get('version') == INDEX_VERSION:
+            self.entries = data.get('entries', {})
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.root_dir,
+                                       prefix=INDEX_FILE + '.')
+            with os.fdopen(fd, 'w') as tmpfd:
+                json.dump({'version': INDEX_VERSION,
+                           'entries': self.entries}, tmpfd)
+
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            # stderr so as not to corrupt machine-readable output
+            print("WARNING: unable to save consumer index '{}' - {}".
+                  format(self.path, exc), file=sys.stderr)
+            return
+
+        self.dirty = False
+
+    def lookup(self, img_path, stat):
+        key = [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+        entry = self.entries.get(img_path)
+        if entry and entry['key'] == key:
+            return entry['backing_file']
+
+        backing_file = probe_backing_file(img_path)
+        self.entries[img_path] = {'key': key, 'backing_file': backing_file}
+        self.dirty = True
+        return backing_file
+
+    def scan(self):
+        seen = set()
+        for path in os.scandir(self.root_dir):
+            if not path.is_dir() or path.name.startswith('.'):
+                continue
+
+            for item in os.scandir(path.path):
+                if item.is_dir():
+                    continue
+
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+
+                seen.add(item.path)
+                yield item.path, self.lookup(item.path, stat)
+
+        for img_path in set(self.entries).difference(seen):
+            del self.entries[img_path]
+            self.dirty = True
+
+
+def iter_backing_files(root_dir, reindex=False):
+    index = ConsumerIndex(root_dir)
+    if not reindex:
+        index.load()
+    else:
+        index.dirty = True
+
+    yield from index.scan()
+    index.save()
+
+
+def get_backing_files(root_dir, reindex=False):
+    return dict(iter_backing_files(root_dir, reindex=reindex))
@@ -0,0 +1,127 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import collections
+import struct
+
+QCOW2_MAGIC = b'QFI\xfb'
+# magic, version, backing_file_offset, backing_file_size, cluster_bits,
+# size, crypt_method, l1_size, l1_table_offset, refcount_table_offset,
+# refcount_table_clusters, nb_snapshots, snapshots_offset
+HEADER_V2 = struct.Struct('>4sIQIIQIIQQIIQ')
+# incompatible_features, compatible_features, autoclear_features,
+# refcount_order, header_length
+HEADER_V3 = struct.Struct('>QQQII')
+EXTENSION = struct.Struct('>II')
+EXT_END = 0x00000000
+EXT_BACKING_FORMAT = 0xE2792ACA
+# qemu refuses backing file names longer than this
+MAX_BACKING_FILE_SIZE = 1023
+
+Qcow2Header = collections.namedtuple('Qcow2Header',
+                                     ['version', 'backing_file',
+                                      'backing_format', 'virtual_size',
+                                      'cluster_size'])
+
+
+def _read_extensions(fd, offset, limit):
+    extensions = {}
+    while offset + EXTENSION.size <= limit:
+        fd.seek(offset)
+        buf = fd.read(EXTENSION.size)
+        if len(buf) < EXTENSION.size:
+            break
+
+        ext_type, ext_len = EXTENSION.unpack(buf)
+        if ext_type == EXT_END:
+            break
+
+        extensions[ext_type] = fd.read(ext_len)
+        offset += EXTENSION.size + ((ext_len + 7) & ~7)
+
+    return extensions
+
+
+def read_header(path):
+    with open(path, 'rb') as fd:
+        if fd.read(len(QCOW2_MAGIC)) != QCOW2_MAGIC:
+            return None
+
+        fd.seek(0)
+        buf = fd.read(HEADER_V2.size + HEADER_V3.size)
+        if len(buf) < HEADER_V2.size:
+            return None
+
+        (_, version, backing_offset, backing_size, cluster_bits,
+         virtual_size, _, _, _, _, _, _, _) = HEADER_V2.unpack_from(buf)
+        if version not in (2, 3):
+            return None
+
+        header_length = HEADER_V2.size
+        if version == 3:
+            if len(buf) < HEADER_V2.size + HEADER_V3.size:
+                return None
+
+            header_length = HEADER_V3.unpack_from(buf, HEADER_V2.size)[4]
+
+        cluster_size = 1 << cluster_bits
+        backing_file = None
+        backing_format = None
+        if backing_offset and backing_size:
+            if backing_size > MAX_BACKING_FILE_SIZE:
+                return None
+
+            # Header extensions live between the end of the header and the
+            # backing file name, which is always within the first cluster.
+            extensions = _read_extensions(fd, header_length,
+                                          min(backing_offset, cluster_size))
+            fmt = extensions.get(EXT_BACKING_FORMAT)
+            if fmt:
+                backing_format = fmt.rstrip(b'\0').decode('utf-8')
+
+            fd.seek(backing_offset)
+            backing_file = fd.read(backing_size).decode('utf-8')
+
+    return Qcow2Header(version, backing_file, backing_format, virtual_size,
+                       cluster_size)
+
+
+# NOTE: the result has no L1 or refcount tables so is only useful to
+# things that just read the header.
+def make_header(virtual_size, backing_file=None, backing_format=None,
+                cluster_bits=16):
+    header_length = HEADER_V2.size + HEADER_V3.size
+    extensions = b''
+    if backing_format:
+        fmt = backing_format.encode('utf-8')
+        extensions += EXTENSION.pack(EXT_BACKING_FORMAT, len(fmt))
+        extensions += fmt + b'\0' * (-len(fmt) % 8)
+
+    extensions += EXTENSION.pack(EXT_END, 0)
+    backing_offset = 0
+    backing = b''
+    if backing_file:
+        backing = backing_file.encode('utf-8')
+        backing_offset = header_length + len(extensions)
+
+    header = HEADER_V2.pack(QCOW2_MAGIC, 3, backing_offset, len(backing),
+                            cluster_bits, virtual_size, 0, 0, 0, 0, 0, 0, 0)
+    header += HEADER_V3.pack(0, 0, 0, 4, header_length)
+    return header + extensions + backing
@@ -0,0 +1,167 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+
+STORE_DIR = '.store'
+# from linux/fs.h
+FICLONE = 0x40049409
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+              'T': 1024 ** 4}
+
+
+def parse_size(size):
+    res = re.match(r'^(\d+)([KMGT]?)B?$', size.strip().upper())
+    if not res:
+        raise Exception("Invalid size '{}'".format(size))
+
+    return int(res.group(1)) * SIZE_UNITS[res.group(2)]
+
+
+def sha256sum(path, checksum=None, blocksize=1024 * 1024):
+    checksum = checksum or hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(blocksize), b''):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+
+def reflink(src, dst):
+    with open(src, 'rb') as srcfd:
+        with open(dst, 'wb') as dstfd:
+            try:
+                fcntl.ioctl(dstfd.fileno(), FICLONE, srcfd.fileno())
+            except OSError:
+                os.remove(dst)
+                raise
+
+
+def clone(src, dst):
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        pass
+
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+class ImageStore():
+    def __init__(self, basedir, max_size=None):
+        self.path = os.path.join(basedir, STORE_DIR)
+        self.max_size = max_size
+
+    def blob_path(self, sha256):
+        return os.path.join(self.path, sha256)
+
+    def has(self, sha256):
+        return os.path.isfile(self.blob_path(sha256))
+
+    def add(self, src, sha256):
+        if self.has(sha256):
+            return
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        tmp = '{}.tmp'.format(self.blob_path(sha256))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        clone(src, tmp)
+        os.replace(tmp, self.blob_path(sha256))
+
+    def checkout(self, sha256, dst):
+        blob = self.blob_path(sha256)
+        method = clone(blob, dst)
+        # mtime is used to track when a blob was last used
+        os.utime(blob)
+        return method
+
+    def blobs(self):
+        blobs = []
+        if not os.path.isdir(self.path):
+            return blobs
+
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                blobs.append({'sha256': entry.name, 'path': entry.path,
+                              'size': stat.st_size,
+                              'links': stat.st_nlink,
+                              'last_used': stat.st_mtime})
+
+        return blobs
+
+    def prune(self, protected, candidates=None):
+        # Only blobs that are no longer hardlinked into any revision are
+        # removed since anything else would free no space.
+        pruned = []
+        for blob in self.blobs():
+            if (blob['links'] != 1 or blob['sha256'] in protected or
+                    (candidates is not None and
+                     blob['sha256'] not in candidates)):
+                continue
+
+            os.remove(blob['path'])
+            pruned.append(blob['sha256'])
+
+        return pruned
+
+    def evict(self, protected):
+        if not self.max_size:
+            return []
+
+        # Blobs hardlinked into a revision take no space beyond what the
+        # revision already uses and evicting them would free nothing.
+        blobs = sorted([b for b in self.blobs() if b['links'] == 1],
+                       key=lambda b: b['last_used'])
+        total = sum(b['size'] for b in blobs)
+        evicted = []
+        for blob in blobs:
+            if total <= self.max_size:
+                break
+
+            if blob['sha256'] in protected:
+                continue
+
+            print("INFO: evicting image '{}' from cache".
+                  format(blob['sha256']))
+            os.remove(blob['path'])
+            total -= blob['size']
+            evicted.append(blob['sha256'])
+
+        if total > self.max_size:
+            print("WARNING: image cache size {} exceeds limit {} but "
+                  "remaining images are in use".format(total, self.max_size))
+
+        return evicted
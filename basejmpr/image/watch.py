@@ -0,0 +1,263 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+
+from basejmpr.image.index import ConsumerIndex
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Data writes to images (IN_MODIFY) are deliberately not watched since
+# running domains would flood us and never change the backing file.
+DIR_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+            IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct('iIII')
+# Events are batched for this long so a burst of creates is published once.
+SETTLE_TIME = 0.2
+
+
+class Inotify():
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                         DIR_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed",
+                          path)
+
+        self.watches[wd] = path
+        return wd
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            path = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+
+            if path is not None or mask & IN_Q_OVERFLOW:
+                yield path, mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class InventoryWatcher():
+
+    def __init__(self, root_dir, backers_path, get_inventory):
+        self.root_dir = root_dir
+        self.backers_path = backers_path
+        self.get_inventory = get_inventory
+        self.index = ConsumerIndex(root_dir)
+        self.inotify = None
+        self.backing_files = {}
+        self.inventory = None
+
+    def _watch(self, path):
+        try:
+            self.inotify.add(path)
+        except OSError as exc:
+            if exc.errno not in [errno.ENOENT, errno.ENOTDIR]:
+                raise
+
+    def _probe(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.backing_files.pop(path, None)
+            self.index.entries.pop(path, None)
+            return
+
+        self.backing_files[path] = self.index.lookup(path, stat)
+
+    def _scan(self):
+        self.inotify.add(self.root_dir)
+        for entry in os.scandir(self.root_dir):
+            if entry.is_dir() and not entry.name.startswith('.'):
+                self._watch(entry.path)
+
+        if os.path.isdir(self.backers_path):
+            for entry in os.scandir(self.backers_path):
+                if entry.is_dir() and not entry.name.startswith('.'):
+                    self._watch(entry.path)
+
+        self.backing_files = dict(self.index.scan())
+
+    def start(self):
+        self.inotify = Inotify()
+        self.rescan()
+
+    def rescan(self):
+        # Re-adding a watch for a path already watched is a no-op so the
+        # same inotify fd is kept and remains registered with the caller.
+        self.index.load()
+        self._scan()
+        self.index.save()
+        self.refresh()
+
+    def _forget(self, dom_path):
+        prefix = dom_path + os.sep
+        for path in [p for p in self.backing_files if p.startswith(prefix)]:
+            self.backing_files.pop(path)
+            self.index.entries.pop(path, None)
+            self.index.dirty = True
+
+    def handle(self, path, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            print("WARNING: inotify queue overflowed - rescanning")
+            self.rescan()
+            return
+
+        if path == self.root_dir:
+            if name.startswith('.'):
+                return
+
+            full = os.path.join(path, name)
+            if mask & (IN_CREATE | IN_MOVED_TO) and mask & IN_ISDIR:
+                self._watch(full)
+                try:
+                    entries = list(os.scandir(full))
+                except OSError:
+                    # Already gone again, its delete event will follow.
+                    return
+
+                for entry in entries:
+                    if not entry.is_dir():
+                        self._probe(entry.path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM) and mask & IN_ISDIR:
+                self._forget(full)
+        elif os.path.dirname(path) == self.backers_path:
+            # Revision contents changed, the catalogue picks this up.
+            return
+        elif path == self.backers_path:
+            if mask & (IN_CREATE | IN_MOVED_TO) and mask & IN_ISDIR:
+                self._watch(os.path.join(path, name))
+        elif name and not mask & IN_ISDIR:
+            self._probe(os.path.join(path, name))
+
+    def refresh(self):
+        self.inventory = dict(self.get_inventory(self.backing_files),
+                              updated=time.time())
+        self.index.save()
+
+    def events(self):
+        # Wait for the queue to settle then drain it.
+        time.sleep(SETTLE_TIME)
+        events = list(self.inotify.read())
+        while events:
+            for event in events:
+                self.handle(*event)
+
+            events = list(self.inotify.read())
+
+
+def write_json(path, data):
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'w') as fd:
+        json.dump(data, fd, indent=2, sort_keys=True)
+
+    os.replace(tmp, path)
+
+
+def serve(watcher, output=None, sock_path=None):
+    # Make sure the socket is cleaned up when stopped by a service manager.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    watcher.start()
+    sel = selectors.DefaultSelector()
+    sel.register(watcher.inotify.fd, selectors.EVENT_READ, 'inotify')
+    server = None
+    if sock_path:
+        if os.path.exists(sock_path):
+            os.unlink(sock_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(sock_path)
+        server.listen(16)
+        sel.register(server, selectors.EVENT_READ, 'socket')
+        print("INFO: serving inventory on {}".format(sock_path))
+
+    if output:
+        write_json(output, watcher.inventory)
+        print("INFO: writing inventory to {}".format(output))
+
+    print("INFO: watching {} for changes".format(watcher.root_dir),
+          flush=True)
+    try:
+        while True:
+            for key, _ in sel.select():
+                if key.data == 'socket':
+                    # Each connection gets a snapshot of the inventory.
+                    conn = server.accept()[0]
+                    with conn:
+                        conn.sendall(json.dumps(watcher.inventory).encode(
+                            'utf-8') + b'\n')
+                else:
+                    watcher.events()
+                    watcher.refresh()
+                    if output:
+                        write_json(output, watcher.inventory)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sel.close()
+        watcher.inotify.close()
+        if server:
+            server.close()
+            os.unlink(sock_path)
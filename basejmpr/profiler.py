@@ -0,0 +1,207 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import collections
+import contextlib
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from importlib import metadata
+
+# Tools whose first argument is a subcommand worth reporting separately.
+SUBCOMMAND_TOOLS = ['qemu-img', 'virsh']
+
+
+def get_version():
+    try:
+        return metadata.version('basejmpr')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[max(0, int(math.ceil(pct / 100.0 * len(values))) - 1)]
+
+
+def get_command_name(cmd):
+    name = os.path.basename(cmd[0])
+    if name in SUBCOMMAND_TOOLS:
+        args = iter(cmd[1:])
+        for arg in args:
+            if arg in ['-c', '--connect']:
+                next(args, None)
+            elif re.match(r'^[a-z][a-z-]*$', arg):
+                return '{} {}'.format(name, arg)
+
+    return name
+
+
+class Profiler():
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._epoch = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.events = []
+        self._epoch = time.perf_counter()
+
+    def _record(self, name, cat, start, wall, cpu):
+        event = {'name': name, 'cat': cat,
+                 'domain': getattr(self._local, 'domain', None),
+                 'tid': threading.get_ident(),
+                 'start': start - self._epoch, 'wall': wall, 'cpu': cpu}
+        with self._lock:
+            self.events.append(event)
+
+    def _child_cpu(self):
+        return getattr(self._local, 'child_cpu', 0.0)
+
+    @contextlib.contextmanager
+    def domain(self, name):
+        prev = getattr(self._local, 'domain', None)
+        self._local.domain = name
+        try:
+            yield
+        finally:
+            self._local.domain = prev
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        cpu = time.thread_time() + self._child_cpu()
+        try:
+            yield
+        finally:
+            self._record(name, 'phase', start, time.perf_counter() - start,
+                         time.thread_time() + self._child_cpu() - cpu)
+
+    def _run(self, cmd, capture=False, **kwargs):
+        start = time.perf_counter()
+        if capture:
+            kwargs['stdout'] = subprocess.PIPE
+
+        with subprocess.Popen(cmd, **kwargs) as proc:
+            out = None
+            if capture:
+                out = proc.stdout.read()
+
+            # wait4() gives us the rusage of this child alone which is not
+            # possible with RUSAGE_CHILDREN when running domains in threads.
+            status, rusage = os.wait4(proc.pid, 0)[1:]
+            if os.WIFEXITED(status):
+                proc.returncode = os.WEXITSTATUS(status)
+            else:
+                proc.returncode = -os.WTERMSIG(status)
+
+        cpu = rusage.ru_utime + rusage.ru_stime
+        self._local.child_cpu = self._child_cpu() + cpu
+        self._record(get_command_name(cmd), 'subprocess', start,
+                     time.perf_counter() - start, cpu)
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd,
+                                                output=out)
+
+        return out
+
+    def check_call(self, cmd, **kwargs):
+        if not self.enabled:
+            return subprocess.check_call(cmd, **kwargs)
+
+        self._run(cmd, **kwargs)
+        return 0
+
+    def check_output(self, cmd, **kwargs):
+        if not self.enabled:
+            return subprocess.check_output(cmd, **kwargs)
+
+        return self._run(cmd, capture=True, **kwargs)
+
+    def summary(self):
+        groups = collections.OrderedDict()
+        for event in sorted(self.events, key=lambda e: e['start']):
+            groups.setdefault((event['cat'], event['name']), []).append(event)
+
+        rows = []
+        for (cat, name), events in groups.items():
+            walls = [e['wall'] for e in events]
+            rows.append({'name': name, 'cat': cat, 'count': len(events),
+                         'total': sum(walls),
+                         'p50': percentile(walls, 50),
+                         'p95': percentile(walls, 95),
+                         'max': max(walls),
+                         'cpu': sum(e['cpu'] for e in events)})
+
+        return rows
+
+    def display_summary(self):
+        domains = set(e['domain'] for e in self.events if e['domain'])
+        print("\nINFO: profile (basejmpr {}, {} domain(s)):".
+              format(get_version(), len(domains)))
+        fmt = "  {:<26} {:<10} {:>6} {:>9} {:>9} {:>9} {:>9} {:>9}"
+        print(fmt.format('name', 'type', 'count', 'total', 'p50', 'p95',
+                         'max', 'cpu'))
+        for row in self.summary():
+            print(fmt.format(row['name'], row['cat'], row['count'],
+                             *['{:.3f}s'.format(row[k]) for k in
+                               ['total', 'p50', 'p95', 'max', 'cpu']]))
+
+        if not self.events:
+            print("  -")
+
+    def write_trace(self, path):
+        pid = os.getpid()
+        tids = {}
+        trace = []
+        for event in sorted(self.events, key=lambda e: e['start']):
+            tid = tids.setdefault(event['tid'], len(tids) + 1)
+            trace.append({'name': event['name'], 'cat': event['cat'],
+                          'ph': 'X', 'pid': pid, 'tid': tid,
+                          'ts': round(event['start'] * 1e6, 3),
+                          'dur': round(event['wall'] * 1e6, 3),
+                          'args': {'domain': event['domain'],
+                                   'cpu_ms': round(event['cpu'] * 1e3, 3)}})
+
+        with open(path, 'w') as fd:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms',
+                       'otherData': {'version': get_version(),
+                                     'summary': self.summary()}}, fd,
+                      indent=1)
+
+        print("INFO: profile trace written to {}".format(path))
+
+
+PROFILER = Profiler()
@@ -0,0 +1,92 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+from basejmpr.domain.artifacts import (
+    ARTIFACTS_FILE,
+    get_artifacts_key,
+    load_artifacts,
+    prune_artifacts,
+    save_artifacts,
+    verify_artifacts,
+)
+
+ARTIFACTS = ['create-domain.sh', 'user-data', 'domain.xml']
+
+
+class TestArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        self.dom_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dom_path)
+        for name in ARTIFACTS:
+            self._write(name, name)
+
+        save_artifacts(self.dom_path, 'key1', ARTIFACTS)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.dom_path, name), 'w') as fd:
+            fd.write(content)
+
+    def test_matching_key(self):
+        self.assertTrue(verify_artifacts(self.dom_path, 'key1'))
+
+    def test_changed_key(self):
+        self.assertFalse(verify_artifacts(self.dom_path, 'key2'))
+
+    def test_no_manifest(self):
+        os.remove(os.path.join(self.dom_path, ARTIFACTS_FILE))
+        self.assertFalse(verify_artifacts(self.dom_path, 'key1'))
+
+    def test_tampered_artifact(self):
+        self._write('user-data', 'tampered')
+        self.assertFalse(verify_artifacts(self.dom_path, 'key1'))
+
+    def test_missing_artifact(self):
+        os.remove(os.path.join(self.dom_path, 'domain.xml'))
+        self.assertFalse(verify_artifacts(self.dom_path, 'key1'))
+
+    def test_prune_keeps_only_artifacts(self):
+        self._write('dom.img', 'disk')
+        os.makedirs(os.path.join(self.dom_path, 'subdir'))
+        prune_artifacts(self.dom_path)
+        self.assertEqual(sorted(os.listdir(self.dom_path)),
+                         sorted(ARTIFACTS + [ARTIFACTS_FILE]))
+        self.assertTrue(verify_artifacts(self.dom_path, 'key1'))
+
+    def test_prune_without_manifest(self):
+        os.remove(os.path.join(self.dom_path, ARTIFACTS_FILE))
+        prune_artifacts(self.dom_path)
+        self.assertEqual(os.listdir(self.dom_path), [])
+        self.assertEqual(load_artifacts(self.dom_path), {})
+
+    def test_key_tracks_inputs(self):
+        ctxt = {'name': 'dom1', 'mem': 512}
+        path = os.path.join(self.dom_path, 'user-data')
+        key = get_artifacts_key(ctxt, [path, None])
+        self.assertEqual(get_artifacts_key(dict(ctxt), [path]), key)
+        self.assertNotEqual(get_artifacts_key(dict(ctxt, mem=1024), [path]),
+                            key)
+        self._write('user-data', 'changed')
+        self.assertNotEqual(get_artifacts_key(ctxt, [path]), key)
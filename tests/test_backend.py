@@ -0,0 +1,148 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import types
+import unittest
+import xml.etree.ElementTree as ET
+from unittest import mock
+
+from basejmpr.domain import backend
+
+try:
+    import libvirt
+except ImportError:
+    libvirt = None
+
+DOMAIN_XML = """<domain type='test'>
+  <name>{}</name>
+  <memory unit='MiB'>128</memory>
+  <os><type>hvm</type></os>
+</domain>
+"""
+
+
+class FakeLibvirtError(Exception):
+    pass
+
+
+class FakeDomain():
+    def __init__(self, name, xml, active=False):
+        self._name = name
+        self.xml = xml
+        self.active = active
+        self.undefined = False
+
+    def name(self):
+        return self._name
+
+    def isActive(self):
+        return self.active
+
+    def destroy(self):
+        self.active = False
+
+    def undefine(self):
+        self.undefined = True
+
+
+class FakeConnection():
+    def __init__(self, uri):
+        self.uri = uri
+        self.domains = {}
+
+    def isAlive(self):
+        return True
+
+    def listAllDomains(self):
+        return list(self.domains.values())
+
+    def lookupByName(self, name):
+        if name not in self.domains:
+            raise FakeLibvirtError("Domain not found: {}".format(name))
+
+        return self.domains[name]
+
+    def defineXML(self, xml):
+        name = ET.fromstring(xml).find('name').text
+        self.domains[name] = FakeDomain(name, xml)
+        return self.domains[name]
+
+
+class TestLibvirtBackendStub(unittest.TestCase):
+
+    def setUp(self):
+        self.conns = []
+
+        def _open(uri):
+            self.conns.append(FakeConnection(uri))
+            return self.conns[-1]
+
+        fake = types.SimpleNamespace(open=_open,
+                                     libvirtError=FakeLibvirtError)
+        patches = [mock.patch.object(backend, 'libvirt', fake),
+                   mock.patch.object(backend, '_CONNECTIONS', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_connection_shared(self):
+        be = backend.get_backend('libvirt', 'test:///stub')
+        be.list_domains()
+        backend.LibvirtBackend('test:///stub').list_domains()
+        self.assertEqual([c.uri for c in self.conns], ['test:///stub'])
+
+    def test_define_and_list(self):
+        be = backend.get_backend('libvirt', 'test:///stub')
+        self.assertEqual(be.list_domains(), set())
+        be.define('d1', DOMAIN_XML.format('d1'))
+        self.assertEqual(be.list_domains(), {'d1'})
+
+    def test_redefine_replaces_existing(self):
+        be = backend.get_backend('libvirt', 'test:///stub')
+        be.define('d1', DOMAIN_XML.format('d1'))
+        old = be.conn.lookupByName('d1')
+        old.active = True
+        be.define('d1', DOMAIN_XML.format('d1'))
+        self.assertFalse(old.active)
+        self.assertTrue(old.undefined)
+        self.assertIsNot(be.conn.lookupByName('d1'), old)
+        self.assertEqual(be.list_domains(), {'d1'})
+
+    def test_missing_bindings(self):
+        with mock.patch.object(backend, 'libvirt', None):
+            self.assertRaises(Exception, backend.get_backend, 'libvirt')
+
+
+@unittest.skipIf(libvirt is None, 'requires the libvirt python bindings')
+class TestLibvirtBackendTestDriver(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(backend, '_CONNECTIONS', {})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.backend = backend.get_backend('libvirt', 'test:///default')
+
+    def test_define_and_list(self):
+        self.assertIn('test', self.backend.list_domains())
+        self.backend.define('basejmpr-test', DOMAIN_XML.format(
+            'basejmpr-test'))
+        self.assertIn('basejmpr-test', self.backend.list_domains())
+        self.backend.define('test', DOMAIN_XML.format('test'))
+        self.assertIn('test', self.backend.list_domains())
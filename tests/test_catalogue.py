@@ -0,0 +1,50 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+
+from basejmpr.image.catalogue import get_catalogue, write_revision_meta
+
+
+class TestRevisionCatalogue(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.basedir)
+        self.catalogue = get_catalogue(self.basedir)
+
+    def test_building_adds_revision(self):
+        with self.catalogue.building('1') as rdir:
+            self.assertEqual(self.catalogue.get('1')['series'], None)
+            write_revision_meta(rdir, 'jammy', 'abc', 10)
+
+        self.assertEqual(self.catalogue.revisions()['1']['series'], 'jammy')
+
+    def test_building_failure_removes_revision(self):
+        with self.assertRaises(ValueError):
+            with self.catalogue.building('1'):
+                self.assertEqual(self.catalogue.names(), ['1'])
+                raise ValueError('boom')
+
+        self.assertEqual(os.listdir(self.basedir), [])
+        self.assertEqual(self.catalogue.revisions(), {})
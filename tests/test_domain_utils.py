@@ -0,0 +1,68 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr.domain.utils import plan_domains
+
+REVISIONS = {'1': {'series': 'jammy', 'files': ['sha1']},
+             '2': {'series': 'jammy', 'files': ['sha2'], 'baked_from': '1',
+                   'dist_upgrade': True, 'snaps': []},
+             '3': {'series': 'jammy', 'files': ['sha3'], 'baked_from': '1',
+                   'dist_upgrade': False, 'snaps': []}}
+
+
+class TestPlanDomains(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        stdout = mock.patch('sys.stdout')
+        stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def _plan(self, revision):
+        return plan_domains(self.root, '/backing_files', revision, 'jammy',
+                            1, REVISIONS, 'dom', '40G', None, 1024, 1, 'hd',
+                            'default', 0, None, None, None, None, None,
+                            'virtio')
+
+    def _user_data(self, revision):
+        dom = self._plan(revision)[0]
+        return dom['seed_builder'].render(dom['name'])['user-data']
+
+    def test_upgraded_revision_skips_package_upgrade(self):
+        self.assertTrue(self._plan('2')[0]['ctxt']['upgraded'])
+        user_data = self._user_data('2')
+        self.assertIn('package_update: False', user_data)
+        self.assertIn('package_upgrade: False', user_data)
+
+    def test_baked_without_upgrade_still_upgrades(self):
+        self.assertFalse(self._plan('3')[0]['ctxt']['upgraded'])
+        user_data = self._user_data('3')
+        self.assertIn('package_upgrade: True', user_data)
+        self.assertNotIn('package_update: False', user_data)
+
+    def test_unbaked_revision_upgrades(self):
+        self.assertFalse(self._plan('1')[0]['ctxt']['upgraded'])
+        self.assertIn('package_upgrade: True', self._user_data('1'))
@@ -0,0 +1,69 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import unittest
+import xml.etree.ElementTree as ET
+
+from basejmpr.domain.domxml import _indent, generate_domain_xml
+
+CTXT = {'img_path': '/dom/d1/d1.img',
+        'name': 'd1',
+        'mem': 1024,
+        'vcpus': 2,
+        'boot_order': 'hd,network',
+        'primary_disk': {'bus': 'virtio'},
+        'disks': [{'name': 'data.img', 'bus': 'scsi'}],
+        'seed_path': '/dom/d1/seed.iso',
+        'networks': ['default', 'ext'],
+        'nic_prefix': 'eth'}
+
+
+class TestDomainXML(unittest.TestCase):
+
+    def test_indent_nested(self):
+        root = ET.fromstring('<a x="1"><b><c /></b><d>text</d></a>')
+        _indent(root)
+        self.assertEqual(ET.tostring(root, encoding='unicode'),
+                         '<a x="1">\n  <b>\n    <c />\n  </b>\n'
+                         '  <d>text</d>\n</a>')
+
+    @unittest.skipUnless(hasattr(ET, 'indent'), 'requires Python >= 3.9')
+    def test_indent_matches_stdlib(self):
+        xml = generate_domain_xml(CTXT)
+        root = ET.fromstring(xml)
+        for elem in root.iter():
+            elem.tail = None
+            if len(elem):
+                elem.text = None
+
+        ET.indent(root)  # novermin
+        self.assertEqual(ET.tostring(root, encoding='unicode') + '\n', xml)
+
+    def test_reproducible(self):
+        self.assertEqual(generate_domain_xml(CTXT),
+                         generate_domain_xml(dict(CTXT)))
+
+    def test_disk_targets(self):
+        root = ET.fromstring(generate_domain_xml(CTXT))
+        targets = [(t.get('dev'), t.get('bus'))
+                   for t in root.iter('target')]
+        self.assertEqual(targets, [('vda', 'virtio'), ('sda', 'scsi'),
+                                   ('vdb', 'virtio')])
+        self.assertIsNotNone(root.find("devices/controller[@type='scsi']"))
@@ -0,0 +1,151 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import contextlib
+import hashlib
+import http.server
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from basejmpr.image.download import download
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    # Set per test by the server
+    ranges = True
+    truncate = 0
+    requests = []
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('Range'))
+        start = 0
+        res = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+        if res and self.ranges:
+            start = int(res.group(1))
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(PAYLOAD) - 1, len(PAYLOAD)))
+        else:
+            self.send_response(200)
+
+        body = PAYLOAD[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.truncate:
+            # Simulate the connection dropping part way through.
+            body = body[:self.truncate]
+            type(self).truncate = 0
+            self.close_connection = True
+
+        self.wfile.write(body)
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        RangeHandler.ranges = True
+        RangeHandler.truncate = 0
+        RangeHandler.requests = []
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      RangeHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/image.img'.format(
+            self.server.server_address[1])
+        self.out = os.path.join(self.tmpdir, 'image.img')
+        self.partial = os.path.join(self.tmpdir, 'image.img.part')
+        self.sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+    def _download(self, sha256=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return download(self.url, self.out, self.partial,
+                            sha256=sha256 or self.sha256)
+
+    def _write_partial(self, data):
+        with open(self.partial, 'wb') as fd:
+            fd.write(data)
+
+    def _read_out(self):
+        with open(self.out, 'rb') as fd:
+            return fd.read()
+
+    def test_full_download(self):
+        self.assertEqual(self._download(), self.sha256)
+        self.assertEqual(self._read_out(), PAYLOAD)
+        self.assertFalse(os.path.exists(self.partial))
+        self.assertEqual(RangeHandler.requests, [None])
+
+    def test_resume(self):
+        self._write_partial(PAYLOAD[:300000])
+        self.assertEqual(self._download(), self.sha256)
+        self.assertEqual(self._read_out(), PAYLOAD)
+        self.assertEqual(RangeHandler.requests, ['bytes=300000-'])
+
+    def test_resume_without_range_support(self):
+        RangeHandler.ranges = False
+        self._write_partial(PAYLOAD[:300000])
+        self.assertEqual(self._download(), self.sha256)
+        self.assertEqual(self._read_out(), PAYLOAD)
+
+    def test_resume_already_complete(self):
+        self._write_partial(PAYLOAD)
+        self.assertEqual(self._download(), self.sha256)
+        self.assertEqual(self._read_out(), PAYLOAD)
+
+    def test_interrupted_then_resumed(self):
+        RangeHandler.truncate = 100000
+        with self.assertRaises(Exception):
+            self._download()
+
+        self.assertFalse(os.path.exists(self.out))
+        self.assertEqual(os.path.getsize(self.partial), 100000)
+        self.assertEqual(self._download(), self.sha256)
+        self.assertEqual(self._read_out(), PAYLOAD)
+        self.assertEqual(RangeHandler.requests, [None, 'bytes=100000-'])
+
+    def test_checksum_mismatch(self):
+        self._write_partial(b'\xff' * 1000)
+        with self.assertRaisesRegex(Exception, 'Checksum mismatch'):
+            self._download()
+
+        # A corrupt partial must not be resumed again.
+        self.assertFalse(os.path.exists(self.partial))
+        self.assertFalse(os.path.exists(self.out))
+        self.assertEqual(self._download(), self.sha256)
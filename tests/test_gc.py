@@ -0,0 +1,211 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr import cli
+from basejmpr.image.catalogue import write_revision_meta
+from basejmpr.image.gc import plan_gc
+from basejmpr.image.qcow2 import make_header
+from basejmpr.image.store import ImageStore
+
+NOW = 1000000
+
+
+def _revs(*specs):
+    return {rev: {'series': series, 'created': created,
+                  'files': ['sha{}'.format(rev)]}
+            for rev, series, created in specs}
+
+
+def _consumer(rev, name='dom.img'):
+    return {'image': name, 'backing_file': '{}/sha'.format(rev)}
+
+
+class TestPlanGC(unittest.TestCase):
+
+    def test_keep_last_per_series(self):
+        revisions = _revs(('1', 'focal', 0), ('2', 'jammy', 0),
+                          ('3', 'focal', 0), ('4', 'focal', 0),
+                          ('5', 'jammy', 0))
+        plan = plan_gc(revisions, {}, keep_last=2, now=NOW)
+        self.assertEqual(sorted(plan['keep']), ['2', '3', '4', '5'])
+        self.assertEqual(plan['delete'], ['1'])
+        self.assertEqual(plan['rebase'], [])
+
+    def test_keep_last_is_at_least_one(self):
+        plan = plan_gc(_revs(('1', 'focal', 0), ('2', 'focal', 0)), {},
+                       keep_last=0, now=NOW)
+        self.assertEqual(list(plan['keep']), ['2'])
+        self.assertEqual(plan['delete'], ['1'])
+
+    def test_keep_newer_than(self):
+        revisions = _revs(('1', 'focal', NOW - 7200),
+                          ('2', 'focal', NOW - 60),
+                          ('3', 'focal', NOW))
+        plan = plan_gc(revisions, {}, keep_newer_than=3600, now=NOW)
+        self.assertEqual(plan['keep'], {'3': 'one of last 1',
+                                        '2': 'too new'})
+        self.assertEqual(plan['delete'], ['1'])
+
+    def test_consumers_kept_without_rebase(self):
+        revisions = _revs(('1', 'focal', 0), ('2', 'focal', 0),
+                          ('3', 'focal', 0))
+        plan = plan_gc(revisions, {'1': [_consumer('1')]}, now=NOW)
+        self.assertEqual(plan['keep']['1'], 'has 1 consumer(s)')
+        self.assertEqual(plan['delete'], ['2'])
+        self.assertEqual(plan['rebase'], [])
+
+    def test_rebase_onto_kept_newest(self):
+        revisions = _revs(('1', 'focal', 0), ('2', 'jammy', 0),
+                          ('3', 'focal', 0), ('4', 'focal', 0),
+                          ('5', 'jammy', 0))
+        c_by_rev = {'1': [_consumer('1', 'a.img')],
+                    '2': [_consumer('2', 'b.img')],
+                    '3': [_consumer('3', 'c.img')]}
+        plan = plan_gc(revisions, c_by_rev, rebase=True, now=NOW)
+        self.assertEqual(sorted(plan['delete']), ['1', '2', '3'])
+        self.assertEqual(sorted((e['image'], e['from'], e['to'])
+                                for e in plan['rebase']),
+                         [('a.img', '1', '4'), ('b.img', '2', '5'),
+                          ('c.img', '3', '4')])
+        for entry in plan['rebase']:
+            self.assertIn(entry['to'], plan['keep'])
+
+    def test_prune_unused_blobs(self):
+        revisions = _revs(('1', 'focal', 0), ('2', 'focal', 0),
+                          ('3', 'focal', 0))
+        plan = plan_gc(revisions, {'2': [_consumer('2')]}, now=NOW,
+                       blobs=['sha1', 'sha2', 'sha3', 'other'])
+        self.assertEqual(plan['delete'], ['1'])
+        self.assertEqual(plan['prune'], ['other', 'sha1'])
+
+
+class TestGCRevisions(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.basedir = os.path.join(self.root, 'backing_files')
+        self.store = ImageStore(self.basedir)
+        for rev in ['1', '2']:
+            self._make_revision(rev)
+
+        self.consumer = self._make_consumer('dom1', '1')
+        stdout = mock.patch('sys.stdout')
+        stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def _make_revision(self, rev, series='focal'):
+        rdir = os.path.join(self.basedir, rev)
+        os.makedirs(os.path.join(rdir, 'targets'))
+        os.makedirs(os.path.join(rdir, 'meta'))
+        sha256 = 'sha{}'.format(rev)
+        img = 'targets/{}-server-cloudimg-amd64.img'.format(series)
+        with open(os.path.join(rdir, img), 'wb') as fd:
+            fd.write(make_header(1024 ** 3))
+
+        os.symlink(img, os.path.join(rdir, sha256))
+        self.store.add(os.path.join(rdir, img), sha256)
+        write_revision_meta(rdir, series, sha256, 0, created=int(rev))
+
+    def _make_consumer(self, name, rev):
+        path = os.path.join(self.root, name, '{}.img'.format(name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._set_backing_file(path, rev)
+        return path
+
+    def _set_backing_file(self, path, rev):
+        backing = os.path.join(self.basedir, rev, 'sha{}'.format(rev))
+        # Replace rather than rewrite so the consumer index sees a new inode.
+        with open(path + '.tmp', 'wb') as fd:
+            fd.write(make_header(1024 ** 3, backing, 'qcow2'))
+
+        os.replace(path + '.tmp', path)
+
+    def _gc(self, **kwargs):
+        return cli.gc_revisions(self.root, self.basedir, **kwargs)
+
+    def _revisions(self):
+        return sorted(r for r in os.listdir(self.basedir)
+                      if not r.startswith('.'))
+
+    def _blobs(self):
+        return sorted(b['sha256'] for b in self.store.blobs())
+
+    def test_dry_run_touches_nothing(self):
+        before = {path: os.stat(path).st_mtime_ns
+                  for path in [self.consumer, self.basedir, self.store.path]}
+        with mock.patch('basejmpr.image.gc.rebase_image') as rebase:
+            plan = self._gc(rebase=True, dry_run=True)
+
+        self.assertEqual(plan['delete'], ['1'])
+        self.assertEqual(plan['prune'], ['sha1'])
+        rebase.assert_not_called()
+        self.assertEqual(self._revisions(), ['1', '2'])
+        self.assertEqual(self._blobs(), ['sha1', 'sha2'])
+        self.assertEqual({path: os.stat(path).st_mtime_ns
+                          for path in before}, before)
+
+    def test_consumers_keep_revision(self):
+        plan = self._gc()
+        self.assertEqual(plan['delete'], [])
+        self.assertEqual(self._revisions(), ['1', '2'])
+
+    def test_rebase_then_delete(self):
+        def _rebase(img, backing_file):
+            self.assertEqual(os.path.dirname(backing_file),
+                             os.path.join(self.basedir, '2'))
+            self._set_backing_file(img, '2')
+
+        with mock.patch('basejmpr.image.gc.rebase_image',
+                        side_effect=_rebase):
+            self._gc(rebase=True)
+
+        self.assertEqual(self._revisions(), ['2'])
+        self.assertEqual(self._blobs(), ['sha2'])
+
+    def test_rebase_failure_keeps_revision(self):
+        with mock.patch('basejmpr.image.gc.rebase_image',
+                        side_effect=Exception('boom')):
+            plan = self._gc(rebase=True)
+
+        self.assertEqual(plan['delete'], ['1'])
+        self.assertEqual(self._revisions(), ['1', '2'])
+        self.assertEqual(self._blobs(), ['sha1', 'sha2'])
+
+    def test_new_consumer_keeps_revision(self):
+        os.remove(self.consumer)
+        display_plan = cli.display_plan
+
+        def _display_plan(plan, revisions):
+            display_plan(plan, revisions)
+            self._make_consumer('dom2', '1')
+
+        with mock.patch.object(cli, 'display_plan',
+                               side_effect=_display_plan):
+            plan = self._gc()
+
+        self.assertEqual(plan['delete'], ['1'])
+        self.assertEqual(self._revisions(), ['1', '2'])
@@ -0,0 +1,91 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr.image import index
+from basejmpr.image.index import INDEX_FILE, get_backing_files
+from basejmpr.image.qcow2 import make_header
+
+
+class TestConsumerIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.img = self._image('dom1', '/backing_files/1/sha1')
+        self.probe = mock.patch.object(index, 'probe_backing_file',
+                                       wraps=index.probe_backing_file)
+
+    def _image(self, dom, backing):
+        path = os.path.join(self.root, dom, '{}.img'.format(dom))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Replace rather than rewrite so the inode changes.
+        with open(path + '.tmp', 'wb') as fd:
+            fd.write(make_header(1024 ** 3, backing, 'qcow2'))
+
+        os.replace(path + '.tmp', path)
+        return path
+
+    def _scan(self, reindex=False):
+        with self.probe as probe:
+            backing_files = get_backing_files(self.root, reindex=reindex)
+
+        return backing_files, sorted(c[0][0] for c in probe.call_args_list)
+
+    def test_first_scan_probes_and_saves(self):
+        backing_files, probed = self._scan()
+        self.assertEqual(backing_files, {self.img: '/backing_files/1/sha1'})
+        self.assertEqual(probed, [self.img])
+        self.assertTrue(os.path.isfile(os.path.join(self.root, INDEX_FILE)))
+
+    def test_unchanged_not_probed(self):
+        self._scan()
+        backing_files, probed = self._scan()
+        self.assertEqual(backing_files, {self.img: '/backing_files/1/sha1'})
+        self.assertEqual(probed, [])
+
+    def test_changed_probed(self):
+        self._scan()
+        other = self._image('dom2', '/backing_files/1/sha1')
+        self._image('dom1', '/backing_files/2/sha2')
+        backing_files, probed = self._scan()
+        self.assertEqual(backing_files, {self.img: '/backing_files/2/sha2',
+                                         other: '/backing_files/1/sha1'})
+        self.assertEqual(probed, sorted([self.img, other]))
+
+    def test_vanished_removed(self):
+        self._scan()
+        shutil.rmtree(os.path.dirname(self.img))
+        backing_files, probed = self._scan()
+        self.assertEqual(backing_files, {})
+        idx = index.ConsumerIndex(self.root)
+        idx.load()
+        self.assertEqual(idx.entries, {})
+
+    def test_reindex_probes_everything(self):
+        self._scan()
+        backing_files, probed = self._scan(reindex=True)
+        self.assertEqual(backing_files, {self.img: '/backing_files/1/sha1'})
+        self.assertEqual(probed, [self.img])
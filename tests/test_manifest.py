@@ -0,0 +1,125 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr.domain import manifest
+from basejmpr.domain.manifest import (
+    GROUP_KEYS,
+    load_manifest,
+    plan_fleet,
+    validate_groups,
+)
+
+REVISIONS = {'1': {'series': 'focal', 'files': ['sha1']},
+             '2': {'series': 'jammy', 'files': ['sha2']}}
+DEFAULTS = {'series': 'jammy', 'memory': 1024, 'num_domains': 1,
+            'root_disk_strategy': 'overlay'}
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _load(self, data, defaults=None):
+        path = os.path.join(self.tmpdir, 'fleet.json')
+        with open(path, 'w') as fd:
+            json.dump(data, fd)
+
+        return load_manifest(path, defaults or DEFAULTS)
+
+    def test_defaults_and_overrides(self):
+        groups = self._load({'defaults': {'memory': 2048},
+                             'domains': [{'name': 'a'},
+                                         {'name': 'b', 'memory': 512}]})
+        self.assertEqual(set(groups[0]), set(GROUP_KEYS))
+        self.assertEqual([(g['name'], g['memory'], g['series'])
+                          for g in groups],
+                         [('a', 2048, 'jammy'), ('b', 512, 'jammy')])
+
+    def test_aliases_and_dashes(self):
+        group = self._load({'domains': [{'name': 'a', 'count': 3,
+                                         'root-disk-size': '20G',
+                                         'revision': 2}]})[0]
+        self.assertEqual(group['num_domains'], 3)
+        self.assertEqual(group['root_disk_size'], '20G')
+        self.assertEqual(group['revision'], '2')
+
+    def test_lists_joined(self):
+        group = self._load({'domains': [{'name': 'a',
+                                         'networks': ['default', 'ext'],
+                                         'snaps': ['lxd'],
+                                         'snaps_classic': 'juju'}]})[0]
+        self.assertEqual(group['networks'], 'default,ext')
+        self.assertEqual(group['snaps'], 'lxd')
+        self.assertEqual(group['snaps_classic'], 'juju')
+
+    def test_relative_paths(self):
+        group = self._load({'domains': [{'name': 'a',
+                                         'user-data': 'cfg/user-data',
+                                         'init_script': '/abs/init.sh'}]})[0]
+        self.assertEqual(group['user_data'],
+                         os.path.join(self.tmpdir, 'cfg/user-data'))
+        self.assertEqual(group['init_script'], '/abs/init.sh')
+
+    def test_unknown_key(self):
+        with self.assertRaisesRegex(Exception, "Unknown manifest key 'mem'"):
+            self._load({'domains': [{'name': 'a', 'mem': 1024}]})
+
+    def test_no_domains(self):
+        self.assertRaises(Exception, self._load, {'defaults': {}})
+
+    def test_group_needs_name(self):
+        self.assertRaises(Exception, self._load, {'domains': [{'count': 2}]})
+
+    def test_duplicate_names(self):
+        groups = self._load({'domains': [{'name': 'web', 'count': 2},
+                                         {'name': 'web1'}]})
+        with self.assertRaisesRegex(Exception, "'web1' is defined more"):
+            validate_groups(REVISIONS, groups)
+
+    def test_bad_revision_fails_before_planning(self):
+        groups = self._load({'domains': [{'name': 'a'},
+                                         {'name': 'b', 'revision': 9}]})
+        with mock.patch.object(manifest, 'plan_domains') as plan:
+            with self.assertRaisesRegex(Exception, "'9' does not exist"):
+                plan_fleet(self.tmpdir, '/backing_files', REVISIONS, groups)
+
+        plan.assert_not_called()
+
+    def test_plan_fleet(self):
+        groups = self._load({'domains': [{'name': 'a'},
+                                         {'name': 'b', 'series': 'focal'}]})
+        with mock.patch.object(manifest, 'plan_domains',
+                               side_effect=lambda *args, **kwargs:
+                               [args[6]]) as plan:
+            domains = plan_fleet(self.tmpdir, '/backing_files', REVISIONS,
+                                 groups)
+
+        self.assertEqual(domains, ['a', 'b'])
+        self.assertEqual([c[0][3] for c in plan.call_args_list],
+                         ['jammy', 'focal'])
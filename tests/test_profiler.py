@@ -0,0 +1,50 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import subprocess
+import unittest
+
+from basejmpr.profiler import Profiler
+
+
+class TestProfilerRun(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.profiler.enable()
+
+    def test_check_output(self):
+        out = self.profiler.check_output(['sh', '-c', 'echo hi'])
+        self.assertEqual(out, b'hi\n')
+        self.assertEqual([(e['name'], e['cat'])
+                          for e in self.profiler.events],
+                         [('sh', 'subprocess')])
+
+    def test_exit_status(self):
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            self.profiler.check_call(['sh', '-c', 'exit 3'])
+
+        self.assertEqual(ctx.exception.returncode, 3)
+
+    def test_killed_by_signal(self):
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            self.profiler.check_call(['sh', '-c', 'kill -TERM $$'])
+
+        self.assertEqual(ctx.exception.returncode, -15)
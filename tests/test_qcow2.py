@@ -0,0 +1,100 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from basejmpr.image.qcow2 import (
+    MAX_BACKING_FILE_SIZE,
+    make_header,
+    read_header,
+)
+
+
+class TestQcow2Header(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write(self, data, name='disk.img'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as fd:
+            fd.write(data)
+
+        return path
+
+    def test_round_trip_with_backing_file(self):
+        path = self._write(make_header(40 * 1024 ** 3, '/a/b/jammy.img',
+                                       'qcow2'))
+        header = read_header(path)
+        self.assertEqual(header.version, 3)
+        self.assertEqual(header.backing_file, '/a/b/jammy.img')
+        self.assertEqual(header.backing_format, 'qcow2')
+        self.assertEqual(header.virtual_size, 40 * 1024 ** 3)
+        self.assertEqual(header.cluster_size, 65536)
+
+    def test_round_trip_without_backing_file(self):
+        path = self._write(make_header(1024 ** 3, cluster_bits=21))
+        header = read_header(path)
+        self.assertIsNone(header.backing_file)
+        self.assertIsNone(header.backing_format)
+        self.assertEqual(header.virtual_size, 1024 ** 3)
+        self.assertEqual(header.cluster_size, 2 * 1024 ** 2)
+
+    def test_backing_file_without_format(self):
+        path = self._write(make_header(1024, 'base.img'))
+        header = read_header(path)
+        self.assertEqual(header.backing_file, 'base.img')
+        self.assertIsNone(header.backing_format)
+
+    def test_not_qcow2(self):
+        self.assertIsNone(read_header(self._write(b'\0' * 512)))
+        self.assertIsNone(read_header(self._write(b'')))
+
+    def test_truncated_header(self):
+        data = make_header(1024, 'base.img', 'qcow2')
+        self.assertIsNone(read_header(self._write(data[:40])))
+
+    def test_unsupported_version(self):
+        data = bytearray(make_header(1024))
+        data[4:8] = (4).to_bytes(4, 'big')
+        self.assertIsNone(read_header(self._write(bytes(data))))
+
+    def test_backing_file_too_long(self):
+        path = self._write(make_header(1024,
+                                       'x' * (MAX_BACKING_FILE_SIZE + 1)))
+        self.assertIsNone(read_header(path))
+
+    @unittest.skipUnless(shutil.which('qemu-img'), "qemu-img not installed")
+    def test_qemu_img_overlay(self):
+        base = os.path.join(self.tmpdir, 'base.img')
+        overlay = os.path.join(self.tmpdir, 'overlay.img')
+        subprocess.check_call(['qemu-img', 'create', '-q', '-f', 'qcow2',
+                               base, '1G'])
+        subprocess.check_call(['qemu-img', 'create', '-q', '-f', 'qcow2',
+                               '-F', 'qcow2', '-b', base, overlay, '2G'])
+        header = read_header(overlay)
+        self.assertEqual(header.backing_file, base)
+        self.assertEqual(header.backing_format, 'qcow2')
+        self.assertEqual(header.virtual_size, 2 * 1024 ** 3)
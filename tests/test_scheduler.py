@@ -0,0 +1,139 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr.domain import scheduler
+from basejmpr.domain.scheduler import CapacityScheduler, read_meminfo
+
+GiB = 1024 ** 3
+MEMINFO = """MemTotal:       16303524 kB
+MemFree:         1203344 kB
+MemAvailable:    8151762 kB
+HugePages_Total:       0
+Hugepagesize:       2048 kB
+"""
+
+
+def _dom(name, mem=1024, vcpus=1, root_size='10G', disks=None):
+    return {'name': name,
+            'ctxt': {'mem': mem, 'vcpus': vcpus, 'root_size': root_size,
+                     'disks': disks}}
+
+
+def _capacity(memory=4, cpu=4, disk=100, load=0.0):
+    return {'memory': memory * GiB, 'cpu': cpu, 'disk': disk * GiB,
+            'load': load}
+
+
+class TestCapacityScheduler(unittest.TestCase):
+
+    def setUp(self):
+        stdout = mock.patch('sys.stdout')
+        stdout.start()
+        self.addCleanup(stdout.stop)
+
+    def test_admit_in_order(self):
+        domains = [_dom('d0', mem=2048), _dom('d1', mem=3072),
+                   _dom('d2', mem=2048)]
+        plan = CapacityScheduler('/').plan(domains, capacity=_capacity())
+        self.assertEqual([d['name'] for d in plan['admitted']],
+                         ['d0', 'd2'])
+        self.assertEqual([(d['name'], over) for d, over in plan['rejected']],
+                         [('d1', ['memory'])])
+        self.assertEqual(plan['used']['memory'], 4 * GiB)
+
+    def test_over_lists_each_resource(self):
+        domains = [_dom('d0', mem=8192, vcpus=128, root_size='500G',
+                        disks=[{'size': '10G'}])]
+        plan = CapacityScheduler('/').plan(domains, capacity=_capacity())
+        self.assertEqual(plan['admitted'], [])
+        self.assertEqual(plan['rejected'][0][1], ['memory', 'cpu', 'disk'])
+
+    def test_disk_includes_extra_disks(self):
+        domains = [_dom('d0', root_size='350G', disks=[{'size': '100G'}])]
+        plan = CapacityScheduler('/').plan(domains, capacity=_capacity())
+        self.assertEqual(plan['rejected'][0][1], ['disk'])
+
+    def test_overcommit_ratios(self):
+        domains = [_dom('d{}'.format(i), mem=2048, vcpus=4)
+                   for i in range(4)]
+        plan = CapacityScheduler('/').plan(domains, capacity=_capacity())
+        self.assertEqual(len(plan['admitted']), 2)
+        self.assertEqual(plan['limits']['cpu'], 64)
+
+        sched = CapacityScheduler('/', ratios={'memory': 2.0})
+        plan = sched.plan(domains, capacity=_capacity())
+        self.assertEqual(len(plan['admitted']), 4)
+        self.assertEqual(plan['limits']['memory'], 8 * GiB)
+
+        sched = CapacityScheduler('/', ratios={'memory': 2.0, 'cpu': 2.0})
+        plan = sched.plan(domains, capacity=_capacity())
+        self.assertEqual(len(plan['admitted']), 2)
+        self.assertEqual([over for _, over in plan['rejected']],
+                         [['cpu'], ['cpu']])
+
+    def test_concurrency_throttled_by_load(self):
+        sched = CapacityScheduler('/')
+        for load, parallel, expected in [(0.0, 8, 4), (1.5, 8, 2),
+                                         (6.0, 8, 1), (0.0, 2, 2),
+                                         (0.0, None, 1)]:
+            plan = sched.plan([], parallel=parallel,
+                              capacity=_capacity(load=load))
+            self.assertEqual(plan['concurrency'], expected)
+
+    def test_schedule_admit_skips(self):
+        domains = [_dom('d0'), _dom('d1', mem=8192)]
+        with mock.patch.object(scheduler, 'get_host_capacity',
+                               return_value=_capacity()):
+            admitted, concurrency, skipped = CapacityScheduler(
+                '/').schedule(domains, parallel=2)
+
+        self.assertEqual([d['name'] for d in admitted], ['d0'])
+        self.assertEqual(concurrency, 2)
+        self.assertEqual(skipped, ['d1'])
+
+    def test_schedule_reject_raises(self):
+        domains = [_dom('d0'), _dom('d1', mem=8192)]
+        sched = CapacityScheduler('/', policy='reject')
+        with mock.patch.object(scheduler, 'get_host_capacity',
+                               return_value=_capacity()):
+            self.assertRaises(Exception, sched.schedule, domains)
+
+
+class TestReadMeminfo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'meminfo')
+        with open(self.path, 'w') as fd:
+            fd.write(MEMINFO)
+
+    def test_read_meminfo(self):
+        info = read_meminfo(self.path)
+        self.assertEqual(info['MemAvailable'], 8151762 * 1024)
+        self.assertEqual(info['MemFree'], 1203344 * 1024)
+        self.assertEqual(info['HugePages_Total'], 0)
+        self.assertEqual(info['Hugepagesize'], 2048 * 1024)
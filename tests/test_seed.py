@@ -0,0 +1,139 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from basejmpr.domain.seed import SECTOR_SIZE, make_iso
+
+
+def _sector(data, index):
+    return data[index * SECTOR_SIZE:(index + 1) * SECTOR_SIZE]
+
+
+def _both32(data, offset):
+    little = struct.unpack_from('<I', data, offset)[0]
+    big = struct.unpack_from('>I', data, offset + 4)[0]
+    assert little == big
+    return little
+
+
+def _walk(data, root_record):
+    extent = _both32(root_record, 2)
+    records = _sector(data, extent)
+    entries = []
+    offset = 0
+    while records[offset]:
+        length = records[offset]
+        record = records[offset:offset + length]
+        ident = record[33:33 + record[32]]
+        entries.append((ident, _both32(record, 2), _both32(record, 10),
+                        record[25]))
+        offset += length
+
+    return extent, entries
+
+
+class TestSeedIso(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'seed.iso')
+
+    def _make(self, files, **kwargs):
+        make_iso(self.path, files, **kwargs)
+        with open(self.path, 'rb') as fd:
+            return fd.read()
+
+    def test_volume_descriptors(self):
+        data = self._make({'user-data': b'#cloud-config\n',
+                           'meta-data': b'instance-id: x\n'})
+        self.assertEqual(len(data) % SECTOR_SIZE, 0)
+        self.assertEqual(data[:16 * SECTOR_SIZE], b'\0' * 16 * SECTOR_SIZE)
+
+        pvd = _sector(data, 16)
+        self.assertEqual(pvd[:7], b'\x01CD001\x01')
+        self.assertEqual(pvd[40:72], b'cidata'.ljust(32))
+        self.assertEqual(_both32(pvd, 80) * SECTOR_SIZE, len(data))
+        self.assertEqual(struct.unpack_from('<H', pvd, 128)[0], SECTOR_SIZE)
+
+        svd = _sector(data, 17)
+        self.assertEqual(svd[:7], b'\x02CD001\x01')
+        self.assertEqual(svd[88:91], b'%/E')
+        self.assertEqual(svd[40:52], 'cidata'.encode('utf-16-be'))
+        self.assertEqual(svd[52:72], b'\0 ' * 10)
+        self.assertEqual(_both32(svd, 80), _both32(pvd, 80))
+
+        self.assertEqual(_sector(data, 18)[:7], b'\xffCD001\x01')
+
+    def test_volume_id(self):
+        data = self._make({'user-data': b''}, volume_id='config-2')
+        self.assertEqual(_sector(data, 16)[40:72], b'config-2'.ljust(32))
+        self.assertEqual(_sector(data, 17)[40:56],
+                         'config-2'.encode('utf-16-be'))
+
+    def test_directories(self):
+        files = {'user-data': b'#cloud-config\n' * 500,
+                 'meta-data': b'instance-id: x\n',
+                 'network-config': b'version: 2\n'}
+        data = self._make(files)
+
+        extent, primary = _walk(data, _sector(data, 16)[156:190])
+        self.assertEqual(primary[0][:2], (b'\0', extent))
+        self.assertEqual(primary[1][:2], (b'\x01', extent))
+        self.assertTrue(primary[0][3] & 2)
+        self.assertEqual([entry[0] for entry in primary[2:]],
+                         [b'META_DAT.;1', b'NETWORK_.;1', b'USER_DAT.;1'])
+
+        extent, joliet = _walk(data, _sector(data, 17)[156:190])
+        self.assertEqual(joliet[0][:2], (b'\0', extent))
+        names = [entry[0].decode('utf-16-be') for entry in joliet[2:]]
+        self.assertEqual(names, sorted(files))
+
+        # Both hierarchies must point at the same file extents.
+        self.assertEqual([entry[1:] for entry in primary[2:]],
+                         [entry[1:] for entry in joliet[2:]])
+        for ident, extent, size, flags in joliet[2:]:
+            self.assertFalse(flags & 2)
+            offset = extent * SECTOR_SIZE
+            self.assertEqual(data[offset:offset + size],
+                             files[ident.decode('utf-16-be')])
+
+    def test_primary_name_collisions(self):
+        data = self._make({'user-data-1': b'a', 'user-data-2': b'b',
+                           'user-data-3': b'c'})
+        _, primary = _walk(data, _sector(data, 16)[156:190])
+        names = [entry[0] for entry in primary[2:]]
+        self.assertEqual(names, [b'USER_DAT.;1', b'USER_DA1.;1',
+                                 b'USER_DA2.;1'])
+
+    def test_empty_file(self):
+        data = self._make({'meta-data': b''})
+        _, joliet = _walk(data, _sector(data, 17)[156:190])
+        self.assertEqual(joliet[2][2], 0)
+
+    def test_too_many_files(self):
+        files = {'file-{:03}'.format(i): b'' for i in range(100)}
+        with self.assertRaisesRegex(Exception, 'Too many files'):
+            make_iso(self.path, files)
@@ -0,0 +1,52 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import unittest
+
+from basejmpr.domain.storage import check_root_disk_options
+
+
+class TestRootDiskOptions(unittest.TestCase):
+
+    def test_allowed(self):
+        for args in [(None,),
+                     ('overlay',),
+                     ('overlay', None, True, '2M'),
+                     ('overlay', 'full', False, '2M'),
+                     ('reflink',),
+                     ('convert', 'falloc', True, '64K')]:
+            check_root_disk_options(*args)
+
+    def test_unknown_strategy(self):
+        self.assertRaises(Exception, check_root_disk_options, 'snapshot')
+
+    def test_copy_strategies_need_backing_file(self):
+        for strategy in ['reflink', 'convert']:
+            self.assertRaises(Exception, check_root_disk_options, strategy,
+                              backingfile=False)
+
+    def test_preallocation_rejected(self):
+        for strategy in ['overlay', 'reflink']:
+            self.assertRaises(Exception, check_root_disk_options, strategy,
+                              'full')
+
+    def test_cluster_size_rejected_with_reflink(self):
+        self.assertRaises(Exception, check_root_disk_options, 'reflink',
+                          cluster_size='2M')
@@ -0,0 +1,112 @@
+# Author: Edward Hope-Morley (opentastic@gmail.com)
+# Description: QEMU Base Image Management Utility
+# Copyright (C) 2017 Edward Hope-Morley
+#
+# License:
+#
+# This file is part of basejmpr.
+#
+# basejmpr is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# basejmpr is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with basejmpr. If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from basejmpr.image.qcow2 import make_header
+from basejmpr.image.watch import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_ISDIR,
+    IN_Q_OVERFLOW,
+    InventoryWatcher,
+)
+
+
+class TestInventoryWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.basedir = os.path.join(self.root, 'backing_files')
+        os.makedirs(os.path.join(self.basedir, '1'))
+        self.backing = os.path.join(self.basedir, '1', 'sha1')
+        stdout = mock.patch('sys.stdout')
+        stdout.start()
+        self.addCleanup(stdout.stop)
+        self.watcher = InventoryWatcher(self.root, self.basedir,
+                                        lambda bf: {'images': dict(bf)})
+        self.watcher.start()
+        self.addCleanup(self.watcher.inotify.close)
+
+    def _image(self, dom, name=None):
+        dom_path = os.path.join(self.root, dom)
+        os.makedirs(dom_path, exist_ok=True)
+        path = os.path.join(dom_path, name or '{}.img'.format(dom))
+        with open(path, 'wb') as fd:
+            fd.write(make_header(1024 ** 3, self.backing, 'qcow2'))
+
+        return path
+
+    def test_domain_dir_created_and_removed(self):
+        img = self._image('dom1')
+        self.watcher.handle(self.root, IN_CREATE | IN_ISDIR, 'dom1')
+        self.assertEqual(self.watcher.backing_files, {img: self.backing})
+        self.assertIn(os.path.join(self.root, 'dom1'),
+                      self.watcher.inotify.watches.values())
+
+        shutil.rmtree(os.path.dirname(img))
+        self.watcher.handle(self.root, IN_DELETE | IN_ISDIR, 'dom1')
+        self.assertEqual(self.watcher.backing_files, {})
+        self.assertNotIn(img, self.watcher.index.entries)
+
+    def test_domain_dir_vanished_before_event(self):
+        self.watcher.handle(self.root, IN_CREATE | IN_ISDIR, 'dom1')
+        self.assertEqual(self.watcher.backing_files, {})
+
+    def test_file_probe_and_delete(self):
+        img = self._image('dom1')
+        self.watcher.rescan()
+        dom_path = os.path.dirname(img)
+        extra = self._image('dom1', 'extra.img')
+        self.watcher.handle(dom_path, IN_CLOSE_WRITE, 'extra.img')
+        self.assertEqual(self.watcher.backing_files,
+                         {img: self.backing, extra: self.backing})
+
+        os.remove(extra)
+        self.watcher.handle(dom_path, IN_DELETE, 'extra.img')
+        self.assertEqual(self.watcher.backing_files, {img: self.backing})
+        self.assertNotIn(extra, self.watcher.index.entries)
+
+    def test_overflow_rescans_with_same_fd(self):
+        fd = self.watcher.inotify.fd
+        img = self._image('dom1')
+        self.watcher.handle(None, IN_Q_OVERFLOW, '')
+        self.assertEqual(self.watcher.inotify.fd, fd)
+        self.assertEqual(self.watcher.backing_files, {img: self.backing})
+        self.assertEqual(self.watcher.inventory['images'],
+                         {img: self.backing})
+
+    def test_revision_events_ignored(self):
+        rev_path = os.path.join(self.basedir, '1')
+        with open(os.path.join(rev_path, 'sha1'), 'wb') as fd:
+            fd.write(make_header(1024 ** 3))
+
+        with mock.patch.object(self.watcher, '_probe') as probe:
+            self.watcher.handle(rev_path, IN_CLOSE_WRITE, 'sha1')
+            self.watcher.handle(rev_path, IN_CREATE | IN_ISDIR, 'targets')
+
+        probe.assert_not_called()
+        self.assertEqual(self.watcher.backing_files, {})